@@ -4,19 +4,22 @@ from flask import Flask
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from flask_bootstrap import Bootstrap
-from flask_bcrypt import Bcrypt
+
+from flasktest.sqlite_profile import get_sqlite_profile, init_sqlite_pragmas
 
 FLASK_KEY = os.environ["FLASK_KEY"]
 SQLITE_URI = os.environ["SQLITE_URI"]
 WEBSITE_DB_URI = os.environ["WEBSITE_DB_URI"]
+SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "wal")
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = FLASK_KEY
 app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{SQLITE_URI}\\website_database.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["SQLITE_PRAGMAS"], app.config["SQLALCHEMY_ENGINE_OPTIONS"] = \
+    get_sqlite_profile(SQLITE_PROFILE)
 
 db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
 Bootstrap(app)
 
 login_manager = LoginManager()
@@ -27,6 +30,7 @@ from flasktest.users.routes import users
 from flasktest.main.routes import main
 from flasktest.apis.routes import apis
 from flasktest.games.routes import games
+from flasktest.query_counter import init_query_counter
 
 app.register_blueprint(users)
 app.register_blueprint(main)
@@ -34,5 +38,9 @@ app.register_blueprint(apis)
 app.register_blueprint(games)
 
 with app.app_context():
-    if not os.path.exists(f"{WEBSITE_DB_URI}\\website_database.db"):
-        db.create_all()
+    from flasktest.migrations import run_migrations
+
+    # Before the first connection is opened, so every connection gets the pragmas
+    init_sqlite_pragmas(db.engine, app.config["SQLITE_PRAGMAS"])
+    run_migrations()
+    init_query_counter(db.engine)
@@ -0,0 +1,83 @@
+"""
+Content addressed cache for the pubg bar charts.
+Charts are keyed by player, game mode, a hash of the dataframe and the chart type,
+so a cached lookup never re-renders and concurrent users never overwrite each other.
+"""
+
+import hashlib
+import os
+import threading
+
+CHART_CACHE_DIR = "flasktest/cache/pubg_charts"
+CHART_CACHE_URL = "/api/pubg/charts/"
+CHART_CACHE_BYTES = int(os.environ.get("PUBG_CHART_CACHE_BYTES", 50 * 1024 * 1024))
+CHART_MAX_AGE = 365 * 24 * 60 * 60  # cached charts never change, so browsers may keep them
+
+
+def hash_dataframe(dataframe):
+    """
+    Takes a dataframe and returns a hash(str) of its contents.
+    Floats are rounded first so a frame read back from disk hashes like the one that was saved.
+    """
+    contents = dataframe.to_csv(index=False, float_format="%.6f")
+    return hashlib.sha1(contents.encode()).hexdigest()
+
+
+def get_chart_location(dataframe_hash, name, mode, chart, extension="png"):
+    """
+    Takes a dataframe_hash(str), player name(str), game mode(str), chart type(str)
+    and file extension(str).
+    Returns the path(str) to save the chart to and the url(str) to render it from.
+    """
+    key = "|".join([name.lower(), mode, dataframe_hash, chart])
+    filename = f"{hashlib.sha1(key.encode()).hexdigest()[:24]}.{extension}"
+    return os.path.join(CHART_CACHE_DIR, filename), f"{CHART_CACHE_URL}{filename}"
+
+
+def is_chart_cached(chart_path):
+    """
+    Takes a chart_path(str).
+    Returns True(bool) and marks the chart as recently used if it is cached,
+    else returns False(bool).
+    """
+    try:
+        os.utime(chart_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def save_chart(chart_path, write):
+    """
+    Takes a chart_path(str) and a write function that saves the chart to a given path.
+    Writes to a temporary file first so readers never see a half written chart,
+    then evicts old charts if the cache is over budget.
+    """
+    os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+    # Unique per process and thread, job threads may render the same chart at the same time
+    temp_path = f"{chart_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    write(temp_path)
+    os.replace(temp_path, chart_path)
+    evict_charts()
+
+
+def evict_charts(max_bytes=CHART_CACHE_BYTES):
+    """
+    Takes max_bytes(int) and removes the least recently used charts
+    until the cache fits within it.
+    """
+    charts = []
+    for entry in os.scandir(CHART_CACHE_DIR):
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            stat = entry.stat()
+            charts.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in charts)
+    for _, size, path in sorted(charts):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
@@ -0,0 +1,162 @@
+"""
+Renders the pubg bar charts with a pluggable backend.
+"kaleido" exports a plotly figure to png through the Kaleido browser process,
+"svg" draws the same styled chart straight to svg without a headless browser.
+"""
+
+import math
+import os
+
+from xml.sax.saxutils import escape
+
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+CHART_BACKEND = os.environ.get("PUBG_CHART_BACKEND", "kaleido")
+CHART_COLOR = "rgb(20,27,37)"
+CHART_FONT = "Josefin Sans"
+CHART_FONT_SIZE = 17
+
+# Plotly's default figure size and margins, so both backends line up
+WIDTH = 700
+HEIGHT = 500
+MARGIN = {"l": 80, "r": 80, "t": 100, "b": 80}
+GRID_COLOR = "#ffffff"
+BAR_WIDTH = 0.8  # share of each category slot taken by its bar
+
+
+# Plotly's default look with our colors and font, built once instead of per figure
+chart_template = go.layout.Template(pio.templates["plotly"])
+chart_template.layout.update(
+    paper_bgcolor="rgba(0,0,0,0)",
+    plot_bgcolor="rgba(0,0,0,0)",
+    font={
+        "family": CHART_FONT,
+        "size": CHART_FONT_SIZE,
+        "color": CHART_COLOR,
+    },
+)
+chart_template.layout.colorway = [CHART_COLOR]
+
+# Load plotly's json engine now, its lazy import breaks when charts render concurrently
+pio.to_json(go.Figure())
+
+
+def render_kaleido(dataframe, x, y, title, xaxis_title, yaxis_title, path):
+    """
+    Takes a dataframe, the x and y columns(str), chart titles(str) and a path(str).
+    Saves a png of a plotly bar chart exported through Kaleido.
+    """
+    bar = px.bar(
+        data_frame=dataframe,
+        x=x,
+        y=y,
+        title=title,
+        template=chart_template,
+    )
+    bar.update_layout(
+        xaxis_title=xaxis_title,
+        yaxis_title=yaxis_title,
+    )
+    bar.write_image(path, format="png", scale=2)
+
+
+def get_nice_ticks(max_value, target=6):
+    """
+    Takes the largest value(float) on the axis and a target(int) number of ticks.
+    Returns the tick values(list) on a 1, 2 or 5 step, and the decimals(int) to show.
+    """
+    if max_value <= 0:
+        return [0, 1], 0
+
+    raw_step = max_value / target
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(factor * magnitude for factor in (1, 2, 5, 10) if factor * magnitude >= raw_step)
+    decimals = max(0, -math.floor(math.log10(step)))
+    ticks = [round(index * step, decimals) for index in range(math.ceil(max_value / step) + 1)]
+    return ticks, decimals
+
+
+def render_svg(dataframe, x, y, title, xaxis_title, yaxis_title, path):
+    """
+    Takes a dataframe, the x and y columns(str), chart titles(str) and a path(str).
+    Saves an svg of the bar chart, drawn directly without plotly or Kaleido.
+    """
+    labels = [str(label) for label in dataframe[x]]
+    values = [float(value) for value in dataframe[y]]
+    ticks, decimals = get_nice_ticks(max(values, default=0))
+
+    left = MARGIN["l"]
+    top = MARGIN["t"]
+    plot_width = WIDTH - MARGIN["l"] - MARGIN["r"]
+    plot_height = HEIGHT - MARGIN["t"] - MARGIN["b"]
+    bottom = top + plot_height
+    scale = plot_height / ticks[-1]
+    slot = plot_width / max(len(values), 1)
+
+    elements = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+        f'viewBox="0 0 {WIDTH} {HEIGHT}" font-family="{CHART_FONT}" '
+        f'font-size="{CHART_FONT_SIZE}" fill="{CHART_COLOR}">',
+        f'<text x="{WIDTH * 0.05:.1f}" y="{top / 2:.1f}" font-size="{CHART_FONT_SIZE + 3}" '
+        f'dominant-baseline="middle">{escape(title)}</text>',
+    ]
+
+    for tick in ticks:
+        tick_y = bottom - tick * scale
+        elements.append(f'<line x1="{left}" x2="{left + plot_width}" y1="{tick_y:.1f}" '
+                        f'y2="{tick_y:.1f}" stroke="{GRID_COLOR}"/>')
+        elements.append(f'<text x="{left - 8}" y="{tick_y:.1f}" text-anchor="end" '
+                        f'dominant-baseline="middle">{tick:.{decimals}f}</text>')
+
+    for index, (label, value) in enumerate(zip(labels, values)):
+        bar_x = left + slot * (index + (1 - BAR_WIDTH) / 2)
+        bar_height = max(value, 0) * scale
+        elements.append(f'<rect x="{bar_x:.1f}" y="{bottom - bar_height:.1f}" '
+                        f'width="{slot * BAR_WIDTH:.1f}" height="{bar_height:.1f}"/>')
+        elements.append(f'<text x="{left + slot * (index + 0.5):.1f}" y="{bottom + 20}" '
+                        f'text-anchor="middle">{escape(label)}</text>')
+
+    elements.append(f'<text x="{left + plot_width / 2:.1f}" y="{HEIGHT - 20}" '
+                    f'text-anchor="middle">{escape(xaxis_title)}</text>')
+    elements.append(f'<text transform="translate(20 {top + plot_height / 2:.1f}) rotate(-90)" '
+                    f'text-anchor="middle">{escape(yaxis_title)}</text>')
+    elements.append("</svg>")
+
+    with open(path, "w", encoding="utf-8") as chart_file:
+        chart_file.write("\n".join(elements))
+
+
+# backend name: (render function, file extension)
+chart_backends = {
+    "kaleido": (render_kaleido, "png"),
+    "svg": (render_svg, "svg"),
+}
+
+
+def get_chart_extension(backend=None):
+    """
+    Takes a backend name(str), defaulting to CHART_BACKEND.
+    Returns the file extension(str) the backend saves charts as.
+    """
+    return chart_backends[backend or CHART_BACKEND][1]
+
+
+def render_bar_chart(dataframe, x, y, title, xaxis_title, yaxis_title, path, backend=None):
+    """
+    Takes a dataframe, the x and y columns(str), chart titles(str), a path(str)
+    and a backend name(str), defaulting to CHART_BACKEND.
+    Saves the bar chart to path with the chosen backend.
+    """
+    render = chart_backends[backend or CHART_BACKEND][0]
+    render(dataframe, x, y, title, xaxis_title, yaxis_title, path)
+
+
+def get_metric_chart(metric):
+    """
+    Takes a metric(str) such as "kills" or "most_kills".
+    Returns the per game column(str) to chart and the metric's display name(str).
+    """
+    column = "_".join(part.capitalize() for part in metric.split("_"))
+    return f"{column}_g", column.replace("_", " ")
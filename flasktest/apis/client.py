@@ -0,0 +1,152 @@
+"""
+HTTP client for the pubg api.
+Keeps one pooled keep-alive session, retries failed requests with jittered backoff,
+revalidates cached responses with ETags and counts latency and status codes per endpoint.
+"""
+
+import threading
+import time
+
+from collections import OrderedDict, Counter
+
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import Retrying, stop_after_attempt, wait_random_exponential, \
+    retry_if_exception_type, retry_if_result
+
+
+class PubgResponse:
+    """
+    Status code and decoded json of a pubg api response.
+    """
+    def __init__(self, status_code, json_data, not_modified=False):
+        self.status_code = status_code
+        self.json_data = json_data
+        self.not_modified = not_modified
+
+    def __repr__(self):
+        return f"PubgResponse(status_code={self.status_code}, not_modified={self.not_modified})"
+
+    def json(self):
+        return self.json_data
+
+
+class PubgClient:
+    """
+    Class containing the pubg api session, retry policy, etag cache and request counters.
+    """
+    def __init__(self, api_key, base_url, timeout=3, pool_size=10, retries=3,
+                 max_backoff=4, etag_cache_size=256, allow_retry=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        # Function called before every retry, returning False(bool) when it may not be sent,
+        # so retries are paid for from the api quota like the first attempt
+        self.allow_retry = allow_retry
+        self.max_backoff = max_backoff
+        self.etag_cache_size = etag_cache_size
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Accept": "application/vnd.api+json",
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.etags = OrderedDict()  # path: (etag, json)
+        self.stats = {}  # endpoint: {"requests", "seconds", "not_modified", "statuses"}
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"PubgClient(base_url={self.base_url})"
+
+    def send(self, endpoint, path, etag=None):
+        """
+        Takes an endpoint(str), a path(str) and the etag(str) of a cached response if any.
+        Makes a single conditional GET request and records it in the endpoint's counters.
+        Returns the requests response.
+        """
+        headers = {"If-None-Match": etag} if etag else {}
+
+        start = time.perf_counter()
+        try:
+            response = self.session.get(f"{self.base_url}{path}", headers=headers,
+                                        timeout=self.timeout)
+        except requests.RequestException:
+            self.record(endpoint, "error", time.perf_counter() - start)
+            raise
+        self.record(endpoint, response.status_code, time.perf_counter() - start)
+        return response
+
+    def get(self, endpoint, path):
+        """
+        Takes an endpoint(str) name used for the counters and a path(str) to request.
+        Retries connection errors, timeouts and 5xx responses with jittered exponential backoff,
+        as long as allow_retry permits it.
+        Returns a PubgResponse, with the cached json for a 304 Not Modified reply.
+        """
+        retrying = Retrying(
+            stop=stop_after_attempt(self.retries),
+            wait=wait_random_exponential(multiplier=0.5, max=self.max_backoff),
+            retry=((retry_if_exception_type((requests.ConnectionError, requests.Timeout))
+                    | retry_if_result(lambda response: response.status_code >= 500))
+                   & self.may_retry),
+            retry_error_callback=lambda state: state.outcome.result(),
+        )
+        with self.lock:
+            cached = self.etags.get(path)
+        response = retrying(self.send, endpoint, path, cached[0] if cached else None)
+
+        if response.status_code == 304:
+            return PubgResponse(200, cached[1], not_modified=True)
+
+        json_data = response.json() if response.status_code == 200 else None
+        etag = response.headers.get("ETag")
+        if etag and json_data is not None:
+            with self.lock:
+                self.etags[path] = (etag, json_data)
+                self.etags.move_to_end(path)
+                while len(self.etags) > self.etag_cache_size:
+                    self.etags.popitem(last=False)
+        return PubgResponse(response.status_code, json_data)
+
+    def may_retry(self, retry_state):
+        """
+        Takes the retry_state of a failed attempt.
+        Returns True(bool) if attempts are left and allow_retry permits another one.
+        """
+        if retry_state.attempt_number >= self.retries:
+            return False
+        return self.allow_retry is None or self.allow_retry()
+
+    def record(self, endpoint, status, seconds):
+        """
+        Takes an endpoint(str), the status code(int) or "error"(str) and the latency(float)
+        of one attempt, and adds them to the endpoint's counters.
+        """
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {"requests": 0, "seconds": 0.0,
+                                                     "not_modified": 0, "statuses": Counter()})
+            stats["requests"] += 1
+            stats["seconds"] += seconds
+            stats["statuses"][status] += 1
+            if status == 304:
+                stats["not_modified"] += 1
+
+    def get_stats(self):
+        """
+        Returns a dict of endpoint(str): request count, average latency in ms,
+        not modified count and status code counts.
+        """
+        with self.lock:
+            return {
+                endpoint: {
+                    "requests": stats["requests"],
+                    "avg_ms": round(stats["seconds"] / stats["requests"] * 1000, 1),
+                    "not_modified": stats["not_modified"],
+                    "statuses": dict(stats["statuses"]),
+                }
+                for endpoint, stats in self.stats.items()
+            }
@@ -0,0 +1,188 @@
+"""
+Background job queue for pubg stat lookups.
+Jobs are persisted in the PubgJob table and run on a small local worker pool,
+so the /api/pubg request returns straight away and the page polls for the result.
+"""
+
+import math
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from flasktest import app, db
+from flasktest.models import PubgJob
+from flasktest.apis.utils import get_player_id, get_seasons, get_all_season_stats, \
+    get_live_season_stats, create_dataframe, render_player_charts
+from flasktest.apis.stats_store import read_player_stats
+
+WORKERS = 2
+JOB_MAX_WAIT = 120  # a background job can afford to wait for api quota
+ACTIVE_STATES = ("queued", "running")
+# Seconds without progress after which a job is taken to be abandoned by its process,
+# longer than the slowest step, fetching every season while waiting for api quota
+JOB_LEASE = 600
+
+pubg_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="pubg-job")
+last_resume = 0
+
+
+def update_pubg_job(job, **changes):
+    """
+    Takes a job(class) and the columns to change.
+    Saves the changes with a fresh updated timestamp.
+    """
+    for column, value in changes.items():
+        setattr(job, column, value)
+    job.updated = math.floor(time.time())
+    db.session.commit()
+
+
+def claim_pubg_job(job_id):
+    """
+    Takes a job_id(int) and marks the job running if it is still queued, so when workers in
+    several processes get the same job only one of them runs it.
+    Returns True(bool) if this worker got the job.
+    """
+    result = db.session.execute(
+        update(PubgJob).where(PubgJob.id == job_id, PubgJob.status == "queued")
+        .values(status="running", progress="Finding player", updated=math.floor(time.time())))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def run_pubg_job(job_id):
+    """
+    Takes a job_id(int) and runs the full pubg lookup for it inside an app context.
+    Records progress as it goes and the chart locations or flash message when done.
+    """
+    with app.app_context():
+        if not claim_pubg_job(job_id):
+            db.session.remove()
+            return
+        job = PubgJob.query.get(job_id)
+
+        try:
+            name = job.name
+            game_mode = job.game_mode
+
+            id_code, id_response = get_player_id(name)
+            if not id_code == 200:
+                return update_pubg_job(job, status="failed", message=id_response)
+
+            update_pubg_job(job, progress="Loading seasons")
+            seasons_code, seasons_response = get_seasons()
+            if not seasons_code == 200:
+                return update_pubg_job(job, status="failed", message=seasons_response)
+
+            stored_stats, _, finalized = read_player_stats(name, game_mode)
+            if stored_stats is None:
+                update_pubg_job(job, progress="Fetching season stats")
+                stats_code, stats_response = get_all_season_stats(
+                    id_response, seasons_response, game_mode, max_wait=JOB_MAX_WAIT)
+            else:
+                # Ended seasons never change, only the live ones are fetched again
+                update_pubg_job(job, progress="Refreshing current season")
+                stats_code, stats_response = get_live_season_stats(
+                    id_response, seasons_response, game_mode, stored_stats, finalized,
+                    max_wait=JOB_MAX_WAIT)
+            if not stats_code == 200:
+                return update_pubg_job(job, status="failed", message=stats_response)
+
+            if len(stats_response[0]) < 2:
+                return update_pubg_job(job, status="failed",
+                                       message="Player has insufficient stats to generate graph")
+
+            update_pubg_job(job, progress="Creating charts")
+            new_df = create_dataframe(stats_response, name, game_mode, seasons_response[0])
+            charts = render_player_charts(new_df, name, game_mode)
+            update_pubg_job(job,
+                            status="done",
+                            progress=None,
+                            kills_img=charts["kills"],
+                            damage_img=charts["damage"],
+                            distance_img=charts["distance"])
+
+        except Exception:
+            app.logger.exception(f"pubg job {job_id} failed")
+            db.session.rollback()
+            update_pubg_job(job, status="failed", progress=None, message="Unexpected error.")
+
+        finally:
+            db.session.remove()
+
+
+def resume_pubg_jobs():
+    """
+    Puts jobs that made no progress for JOB_LEASE seconds, left behind by a process that
+    stopped, back on the worker pool. Jobs other processes are still running are left alone.
+    Checked at most once every JOB_LEASE seconds per process.
+    """
+    global last_resume
+    now = math.floor(time.time())
+    if now - last_resume < JOB_LEASE:
+        return
+    last_resume = now
+
+    stale = PubgJob.status.in_(ACTIVE_STATES), PubgJob.updated < now - JOB_LEASE
+    job_ids = db.session.execute(select(PubgJob.id).where(*stale)).scalars().all()
+    for job_id in job_ids:
+        # Another process resuming at the same time takes each job at most once
+        result = db.session.execute(update(PubgJob).where(PubgJob.id == job_id, *stale)
+                                    .values(status="queued", updated=now))
+        db.session.commit()
+        if result.rowcount == 1:
+            pubg_executor.submit(run_pubg_job, job_id)
+
+
+def submit_pubg_job(name, game_mode):
+    """
+    Takes a player name(str) and game mode(str).
+    Returns the id(int) of the in-flight job for this lookup, or of a newly queued one.
+    """
+    resume_pubg_jobs()
+    while True:
+        job_id = db.session.execute(
+            select(PubgJob.id).where(PubgJob.name == name, PubgJob.game_mode == game_mode,
+                                     PubgJob.status.in_(ACTIVE_STATES))).scalar()
+        if job_id is not None:
+            return job_id
+
+        now = math.floor(time.time())
+        # noinspection PyArgumentList
+        job = PubgJob(name=name, game_mode=game_mode, status="queued",
+                      progress="Waiting in queue", created=now, updated=now)
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # ix_pubg_job_active, a request in this or another worker queued it first
+            db.session.rollback()
+            continue
+
+        pubg_executor.submit(run_pubg_job, job.id)
+        return job.id
+
+
+def get_pubg_job_status(job_id):
+    """
+    Takes a job_id(int).
+    Returns the job's status(dict) to be sent as json, or None if there is no such job.
+    """
+    job = PubgJob.query.get(job_id)
+    if job is None:
+        return None
+
+    return {
+        "id": job.id,
+        "name": job.name,
+        "game_mode": job.game_mode,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "kills_img": job.kills_img,
+        "damage_img": job.damage_img,
+        "distance_img": job.distance_img,
+    }
@@ -0,0 +1,110 @@
+"""
+Two tier cache for pubg api lookups that rarely change, the seasons list and player ids.
+An in-process LRU sits in front of the PubgLookupCache table, so entries survive restarts
+and are shared between worker processes. Expired rows are deleted by the writes, at most once
+every PURGE_INTERVAL seconds per process.
+"""
+
+import json
+import math
+import threading
+import time
+
+from collections import OrderedDict
+
+from sqlalchemy import delete
+
+from flasktest import db
+from flasktest.models import PubgLookupCache
+
+PURGE_INTERVAL = 3600  # seconds between deletes of expired rows
+
+
+class LookupCache:
+    """
+    Class containing the in-process LRU, its database tier and hit/miss counters.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key: (expires, value)
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+        self.last_purge = 0
+
+    def __repr__(self):
+        return f"LookupCache(entries={len(self.entries)}, max_entries={self.max_entries})"
+
+    def remember(self, key, expires, value):
+        """
+        Takes a key(str), expires(int) timestamp and value and keeps them in the LRU.
+        """
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def count(self, counter):
+        """
+        Takes a counter(str) name and adds one to it.
+        """
+        with self.lock:
+            self.counters[counter] += 1
+
+    def get(self, key):
+        """
+        Takes a key(str).
+        Returns the cached value if it has not expired, else returns None.
+        """
+        now = time.time()
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached and cached[0] > now:
+                self.entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return cached[1]
+
+        row = PubgLookupCache.query.get(key)
+        if row is None or row.expires <= now:
+            self.count("misses")
+            return None
+
+        value = json.loads(row.value)
+        self.remember(key, row.expires, value)
+        self.count("db_hits")
+        return value
+
+    def claim_purge(self, now):
+        """
+        Takes the current time(int).
+        Returns True(bool) if PURGE_INTERVAL has passed since this process last purged.
+        """
+        with self.lock:
+            if now - self.last_purge < PURGE_INTERVAL:
+                return False
+            self.last_purge = now
+            return True
+
+    def set(self, key, value, ttl):
+        """
+        Takes a key(str), a json serializable value and ttl(int) in seconds.
+        Saves the value in both tiers, deleting expired rows when a purge is due.
+        """
+        now = math.floor(time.time())
+        expires = now + ttl
+        self.remember(key, expires, value)
+        db.session.merge(PubgLookupCache(key=key, value=json.dumps(value), expires=expires))
+        if self.claim_purge(now):
+            # Rows are only read by key, every player ever looked up would stay in the table
+            db.session.execute(delete(PubgLookupCache).where(PubgLookupCache.expires <= now))
+        db.session.commit()
+
+    def get_stats(self):
+        """
+        Returns a dict of hit and miss counts(int) and the hit rate(float).
+        """
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = sum(stats.values())
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        return stats
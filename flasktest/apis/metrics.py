@@ -0,0 +1,66 @@
+"""
+Declarative registry of the derived pubg stats.
+Every metric is a numerator column divided by a denominator column, optionally transformed,
+and all of them are computed in one vectorized pass over a 2-D array of raw season stats.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+Metric = namedtuple("Metric", ["numerator", "denominator", "transform"], defaults=[None])
+
+# Raw stat columns, in the order they are laid out in the raw stats array
+raw_columns = ["Games", "Wins", "Top10s", "Damage", "Kills", "Headshots", "Assists",
+               "Most_Kills", "Distance"]
+
+# metric name: Metric(numerator column, denominator column, transform applied to the ratio)
+metric_registry = {
+    "Wins_g": Metric("Wins", "Games"),
+    "Top10s_g": Metric("Top10s", "Games"),
+    "Damage_g": Metric("Damage", "Games"),
+    "Kills_g": Metric("Kills", "Games"),
+    "Headshots_g": Metric("Headshots", "Games"),
+    "Assists_g": Metric("Assists", "Games"),
+    "Most_Kills_g": Metric("Most_Kills", "Games"),
+    "Distance_g": Metric("Distance", "Games"),
+}
+
+numerator_index = np.array([raw_columns.index(metric.numerator)
+                            for metric in metric_registry.values()])
+denominator_index = np.array([raw_columns.index(metric.denominator)
+                              for metric in metric_registry.values()])
+
+
+def compute_metrics(raw_stats):
+    """
+    Takes raw_stats, a 2-D array with one row per player season and the raw_columns as columns.
+    Returns a 2-D array(float) with one column per registered metric, 0 where dividing by 0.
+    """
+    raw_stats = np.asarray(raw_stats, dtype=float)
+    numerators = raw_stats[:, numerator_index]
+    denominators = raw_stats[:, denominator_index]
+    metrics = np.divide(numerators, denominators, out=np.zeros_like(numerators),
+                        where=denominators != 0)
+
+    for column, metric in enumerate(metric_registry.values()):
+        if metric.transform is not None:
+            metrics[:, column] = metric.transform(metrics[:, column])
+    return metrics
+
+
+def add_metric_columns(dataframe):
+    """
+    Takes a dataframe holding the raw_columns for any number of players and seasons.
+    Returns the dataframe with every registered metric added next to its numerator column.
+    """
+    metrics = compute_metrics(dataframe[raw_columns].to_numpy())
+    metric_frame = pd.DataFrame(metrics, columns=list(metric_registry), index=dataframe.index)
+
+    columns = []
+    for column in dataframe.columns:
+        columns.append(column)
+        columns.extend(name for name, metric in metric_registry.items()
+                       if metric.numerator == column)
+    return pd.concat([dataframe, metric_frame], axis=1)[columns]
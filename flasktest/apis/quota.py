@@ -0,0 +1,138 @@
+"""
+Pubg api quota shared by every worker process.
+The token bucket lives in the APIQuota table and is updated inside BEGIN IMMEDIATE transactions,
+so concurrent workers never spend the same token and free capacity is admitted straight away.
+"""
+
+import asyncio
+import math
+import sqlite3
+import time
+
+from contextlib import closing
+
+from flasktest import db
+from flasktest.models import APIQuota
+
+BUSY_TIMEOUT = 5  # seconds a worker waits for another worker's quota transaction
+
+
+class SharedTokenBucket:
+    """
+    Token bucket rate limiter stored in sqlite, holding up to capacity tokens,
+    refilled at rate tokens every per seconds.
+    """
+    def __init__(self, api_name, rate, per, capacity=None, database=None):
+        self.api_name = api_name
+        self.capacity = capacity or rate
+        self.fill_rate = rate / per
+        self.database = database
+
+    def __repr__(self):
+        return f"SharedTokenBucket(api_name={self.api_name}, capacity={self.capacity})"
+
+    def connect(self):
+        """
+        Returns a new sqlite3 connection to the app database, without implicit transactions.
+        """
+        if self.database is None:
+            self.database = db.engine.url.database
+        return sqlite3.connect(self.database, timeout=BUSY_TIMEOUT, isolation_level=None)
+
+    def refill(self, row, now):
+        """
+        Takes the stored (tokens, updated) row, None if there is none, and the time(float) now.
+        Returns the tokens(float) in the bucket now.
+        """
+        if row is None:
+            return self.capacity
+        return min(self.capacity, row[0] + (now - row[1]) * self.fill_rate)
+
+    def read(self):
+        """
+        Returns the tokens(float) in the bucket now, computed from a plain read of the stored
+        row, so checking the quota never takes the write lock the spending workers need.
+        """
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                f"SELECT tokens, updated FROM {APIQuota.__tablename__} WHERE api_name = ?",
+                (self.api_name,)).fetchone()
+        return self.refill(row, time.time())
+
+    def update(self, spend=0, drain=False):
+        """
+        Takes the number of tokens to spend(int) and whether to drain(bool) the bucket.
+        Refills the bucket and spends the tokens if enough are left, in one locked transaction.
+        Returns the tokens(float) left and True(bool) if the tokens were spent.
+        """
+        with closing(self.connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    f"SELECT tokens, updated FROM {APIQuota.__tablename__} WHERE api_name = ?",
+                    (self.api_name,)).fetchone()
+                now = time.time()
+                tokens = self.refill(row, now)
+
+                spent = tokens >= spend
+                if drain:
+                    tokens = 0
+                elif spent:
+                    tokens -= spend
+
+                connection.execute(
+                    f"INSERT INTO {APIQuota.__tablename__} (api_name, tokens, updated)"
+                    f" VALUES (?, ?, ?) ON CONFLICT(api_name)"
+                    f" DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (self.api_name, tokens, now))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return tokens, spent
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available and returns 0,
+        else returns the seconds(float) until the next token is available.
+        """
+        tokens, spent = self.update(spend=1)
+        if spent:
+            return 0
+        return (1 - tokens) / self.fill_rate
+
+    async def acquire(self, max_wait=None):
+        """
+        Waits for a token without blocking the event loop.
+        Returns True(bool) once a token is taken,
+        else returns False(bool) if that would take longer than max_wait seconds.
+        """
+        loop = asyncio.get_running_loop()
+        waited = 0
+        while True:
+            delay = await loop.run_in_executor(None, self.try_acquire)
+            if not delay:
+                return True
+            if max_wait is not None and waited + delay > max_wait:
+                return False
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """
+        Empties the bucket, used when the api itself answers 429 Too Many Requests.
+        """
+        self.update(drain=True)
+
+    def get_status(self):
+        """
+        Returns a dict of the remaining requests(int), capacity(int), seconds(int) until
+        the next request is admitted and seconds(int) until the quota is fully reset.
+        """
+        tokens = self.read()
+        return {
+            "remaining": math.floor(tokens),
+            "capacity": self.capacity,
+            "next_in": math.ceil(max(0, 1 - tokens) / self.fill_rate),
+            "reset_in": math.ceil((self.capacity - tokens) / self.fill_rate),
+        }
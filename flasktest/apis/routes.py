@@ -1,15 +1,15 @@
 
-import time
 import os
 
-from flask import render_template, request, flash
+from flask import render_template, request, flash, jsonify, send_from_directory
 from flask_login import login_required
 
-from flasktest.models import APIData
 from flasktest.apis.forms import SearchPUBGForm
-from flasktest.apis.utils import get_player_id, get_seasons, get_all_season_stats, \
-    create_dataframe, create_kills_bar, create_damage_bar, create_distance_bar,\
-    load_old_pubg_data, get_pubg_cooldown_message, update_pubg_api_data
+from flasktest.apis.utils import load_player_dataframe, load_old_pubg_data, \
+    get_pubg_cooldown_message, pubg_client, pubg_lookup_cache, pubg_quota
+from flasktest.apis.stats_store import is_fresh
+from flasktest.apis.jobs import submit_pubg_job, get_pubg_job_status
+from flasktest.apis.chart_cache import CHART_CACHE_DIR, CHART_MAX_AGE
 
 from flask import Blueprint
 
@@ -23,8 +23,6 @@ def pubg():
     kills_img = "../static/images/api/pubg/example_kills.png"
     damage_img = "../static/images/api/pubg/example_damage.png"
     distance_img = "../static/images/api/pubg/example_distance.png"
-    df_path = "flasktest/static/data/api/pubg/df_"
-    pubg_data = APIData.query.filter_by(api_name="pubg").first()
 
     if request.method == "GET":
         return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
@@ -33,91 +31,66 @@ def pubg():
     if pubg_form.validate_on_submit():
         name = pubg_form.name.data
         game_mode = pubg_form.game_mode.data + pubg_form.perspective.data
-        save_mode = game_mode.replace("-", "_")
 
         # Check for existing data before contacting API
-        if os.path.exists(f"{df_path}{name}_{save_mode}.csv"):
-            kills_img, damage_img, distance_img = \
-                load_old_pubg_data(df_path, name, game_mode, save_mode)
+        old_df, fetched = load_player_dataframe(name, game_mode)
+        if old_df is not None:
+            kills_img, damage_img, distance_img = load_old_pubg_data(old_df, name, game_mode)
+            job_id = None
+            if not is_fresh(fetched):
+                # Show the stored charts while they are refreshed in the background
+                job_id = submit_pubg_job(name, game_mode)
 
             return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
                                    damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="pubg-section", page="pubg")
+                                   job_id=job_id, scrollToAnchor="pubg-section", page="pubg")
 
         # No data found - contact API
-        # Check API availability
-        if (pubg_data.last_used + 60) > time.time():
-            # API used in last 60 seconds
+        # Check API availability, shared with every worker
+        if pubg_quota.get_status()["remaining"] < 1:
+            # Quota used up, admitted again once a request frees up
             flash_message = get_pubg_cooldown_message()
             flash(flash_message)
             return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
                                    damage_img=damage_img, distance_img=distance_img,
                                    scrollToAnchor="pubg-section", page="pubg")
 
-        id_code, id_response = get_player_id(name)
-        if not id_code == 200:
-            # Unsuccessful request - see pubg_imp.py for more info
-            if id_code == 429:
-                # Request limit reached
-                update_pubg_api_data()
-
-            flash_message = id_response
-            flash(flash_message)
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="pubg-section", page="pubg")
-
-        player_id = id_response
-        # Player ID retrieved successfully
-        seasons_code, seasons_response = get_seasons()
-        if not seasons_code == 200:
-            # Unsuccessful request - see pubg_imp.py for more info
-            flash_message = seasons_response
-            if seasons_code == 429:
-                # Request limit reached
-                update_pubg_api_data()
-
-            flash(flash_message)
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="pubg-section", page="pubg")
-
-        valid_seasons = seasons_response
-        # Valid seasons retrieved successfully
-        stats_code, stats_response = get_all_season_stats(player_id, valid_seasons, game_mode)
-        if not stats_code == 200:
-            # Unsuccessful request - see pubg_imp.py for more info
-            flash_message = stats_response
-            if stats_code == 429:
-                # Request limit reached
-                update_pubg_api_data()
-
-            flash(flash_message)
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="pubg-section", page="pubg")
-
-        player_stats = stats_response
-        # Player stats retrieved successfully
-        if len(player_stats[0]) < 2:
-            # Check if player was active in at least 2 seasons, else draw no graph
-            flash("Player has insufficient stats to generate graph")
-            return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
-                                   damage_img=damage_img, distance_img=distance_img,
-                                   scrollToAnchor="pubg-section", page="pubg")
-
-        # Success
-        new_df = create_dataframe(player_stats, name, save_mode)
-        kills_img = create_kills_bar(new_df, name, game_mode)
-        damage_img = create_damage_bar(new_df, name, game_mode)
-        distance_img = create_distance_bar(new_df, name, game_mode)
-        # Update api db with timestamp
-        update_pubg_api_data()
+        # Look the player up in the background, the page polls the job for the charts
+        job_id = submit_pubg_job(name, game_mode)
         return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
                                damage_img=damage_img, distance_img=distance_img,
-                               scrollToAnchor="pubg-section", page="pubg")
+                               job_id=job_id, scrollToAnchor="pubg-section", page="pubg")
 
     # Form not validated
     return render_template("/api/pubg.html", pubg_form=pubg_form, kills_img=kills_img,
                            damage_img=damage_img, distance_img=distance_img,
                            scrollToAnchor="pubg-section", page="pubg")
+
+
+@apis.route("/api/pubg/jobs/<int:job_id>")
+@login_required
+def pubg_job(job_id):
+    job_status = get_pubg_job_status(job_id)
+    if job_status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_status)
+
+
+@apis.route("/api/pubg/charts/<filename>")
+@login_required
+def pubg_chart(filename):
+    # Chart names are content hashes, so a url always points at the same image
+    response = send_from_directory(os.path.abspath(CHART_CACHE_DIR), filename,
+                                   max_age=CHART_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+
+@apis.route("/api/pubg/stats")
+@login_required
+def pubg_stats():
+    return jsonify({
+        "requests": pubg_client.get_stats(),
+        "lookup_cache": pubg_lookup_cache.get_stats(),
+        "quota": pubg_quota.get_status(),
+    })
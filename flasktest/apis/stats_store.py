@@ -0,0 +1,136 @@
+"""
+Single indexed store for pubg season stats, replacing one csv file per player and game mode.
+Rows hold the raw season stats, the per game columns are derived when a frame is built.
+Seasons that have ended are flagged as finalized, so a refresh only refetches the live ones.
+"""
+
+import math
+import os
+import re
+import time
+
+import pandas as pd
+from sqlalchemy import select, delete, insert
+
+from flasktest import app, db
+from flasktest.models import PubgSeasonStats
+
+STATS_TTL = int(os.environ.get("PUBG_STATS_TTL", 60 * 60))  # seconds before a refresh
+CSV_DIR = "flasktest/static/data/api/pubg"
+csv_name_pattern = re.compile(r"^df_(?P<name>.+)_(?P<mode>(?:solo|duo|squad)(?:_fpp)?)\.csv$")
+
+# player_stats list order used by get_all_season_stats and create_dataframe
+stats_columns = ["assists", "damage", "kills", "headshots", "most_kills",
+                 "distance", "top10s", "games", "wins", "season"]
+
+
+def select_player_stats(name, game_mode):
+    """
+    Takes a player name(str) and game mode(str).
+    Returns the select statement for the player's seasons, newest first.
+    """
+    columns = [getattr(PubgSeasonStats, column) for column in stats_columns]
+    return select(*columns, PubgSeasonStats.finalized, PubgSeasonStats.fetched)\
+        .where(PubgSeasonStats.player == name, PubgSeasonStats.game_mode == game_mode)\
+        .order_by(PubgSeasonStats.position)
+
+
+def read_player_stats(name, game_mode):
+    """
+    Takes a player name(str) and game mode(str).
+    Returns the player_stats(list), the time(int) they were fetched and
+    the finalized flag(list) of each season,
+    else returns None, None, None if the player is not stored.
+    """
+    rows = db.session.execute(select_player_stats(name, game_mode)).all()
+    if not rows:
+        return None, None, None
+
+    player_stats = [list(column) for column in zip(*rows)]
+    fetched = min(player_stats.pop())
+    finalized = player_stats.pop()
+    return player_stats, fetched, finalized
+
+
+def read_all_stats():
+    """
+    Returns every stored season as one df, with player and game_mode columns
+    and the raw stats named like the player df columns, for bulk recomputation.
+    """
+    columns = [getattr(PubgSeasonStats, column) for column in stats_columns]
+    rows = db.session.execute(
+        select(PubgSeasonStats.player, PubgSeasonStats.game_mode, *columns)
+        .order_by(PubgSeasonStats.player, PubgSeasonStats.game_mode, PubgSeasonStats.position)
+    ).all()
+    frame_columns = ["_".join(part.capitalize() for part in column.split("_"))
+                     for column in stats_columns]
+    return pd.DataFrame(rows, columns=["player", "game_mode", *frame_columns])
+
+
+def is_fresh(fetched, max_age=STATS_TTL):
+    """
+    Takes a fetched(int) timestamp and max_age(int) in seconds.
+    Returns True(bool) if the stats are young enough to serve without a refresh.
+    """
+    return fetched is not None and fetched + max_age > time.time()
+
+
+def write_player_stats(name, game_mode, player_stats, finalized=None, fetched=None):
+    """
+    Takes a player name(str), game mode(str), player_stats(list), the finalized flag(list)
+    of each season and fetched(int) timestamp.
+    Without flags only the newest season is left open, as it may still be live.
+    Replaces the player's stored seasons in a single transaction.
+    """
+    fetched = fetched or math.floor(time.time())
+    finalized = finalized or [position > 0 for position in range(len(player_stats[0]))]
+    rows = [
+        dict(zip(stats_columns, season_stats), player=name, game_mode=game_mode,
+             position=position, finalized=season_finalized, fetched=fetched)
+        for position, (season_stats, season_finalized)
+        in enumerate(zip(zip(*player_stats), finalized))
+    ]
+    db.session.execute(delete(PubgSeasonStats).where(PubgSeasonStats.player == name,
+                                                     PubgSeasonStats.game_mode == game_mode))
+    if rows:
+        db.session.execute(insert(PubgSeasonStats), rows)
+    db.session.commit()
+
+
+def read_csv_stats(csv_path):
+    """
+    Takes the path(str) of an old df_{name}_{mode}.csv file.
+    Returns its player_stats(list).
+    """
+    df_player = pd.read_csv(csv_path)
+    return [df_player.Assists.tolist(), df_player.Damage.tolist(), df_player.Kills.tolist(),
+            df_player.Headshots.tolist(), df_player.Most_Kills.tolist(),
+            df_player.Distance.tolist(), df_player.Top10s.tolist(), df_player.Games.tolist(),
+            df_player.Wins.tolist(), df_player.Season.tolist()]
+
+
+def migrate_csv_stats(csv_dir=CSV_DIR):
+    """
+    Takes a csv_dir(str) and copies every df_{name}_{mode}.csv in it into the stats store,
+    using the file's modification time as its fetched time.
+    Returns the number(int) of files migrated.
+    """
+    migrated = 0
+    for entry in os.scandir(csv_dir):
+        match = csv_name_pattern.match(entry.name)
+        if not match:
+            continue
+
+        game_mode = match["mode"].replace("_", "-")
+        write_player_stats(match["name"], game_mode, read_csv_stats(entry.path),
+                           fetched=math.floor(entry.stat().st_mtime))
+        migrated += 1
+    return migrated
+
+
+@app.cli.command("migrate-pubg-csv")
+def migrate_csv_stats_command():
+    """
+    Copies the old per player csv files into the stats store.
+    """
+    print(f"Migrated {migrate_csv_stats()} csv files into the stats store.")
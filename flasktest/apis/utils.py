@@ -1,57 +1,88 @@
 import os
-import time
-import requests
+import asyncio
 import pandas as pd
-import math
-import plotly.express as px
 
-from flasktest.models import APIData
-from flasktest import db
+from concurrent.futures import ThreadPoolExecutor
+
+from flasktest.apis.chart_cache import hash_dataframe, get_chart_location, is_chart_cached, \
+    save_chart
+from flasktest.apis.charts import get_chart_extension, get_metric_chart, render_bar_chart
+from flasktest.apis.stats_store import read_player_stats, write_player_stats
+from flasktest.apis.metrics import add_metric_columns
+from flasktest.apis.client import PubgClient
+from flasktest.apis.lookup_cache import LookupCache
+from flasktest.apis.quota import SharedTokenBucket
 
 
 PUBG_API_KEY = os.environ["PUBG_API_KEY"]
+PUBG_API_URL = os.environ.get("PUBG_API_URL", "https://api.pubg.com")  # point at a stub for tests
 TIMEOUT = 3
 NR_OF_BARS = 6  # nr of bars created in the charts
-
-get_player_id_url = "https://api.pubg.com/shards/steam/players?filter[playerNames]="
-get_seasons_url = "https://api.pubg.com/shards/steam/seasons"
+PLAYER_CHART_METRICS = ("kills", "damage", "distance")  # charts shown on the pubg page
+REQUESTS_PER_MINUTE = 10  # pubg api quota
+MAX_WAIT = 10  # max seconds a lookup waits for quota before giving up
+SEASONS_TTL = 24 * 60 * 60  # new seasons start a few times a year
+CHECKED_SEASON_TTL = 365 * 24 * 60 * 60  # ended seasons never change
+PLAYER_ID_TTL = 30 * 24 * 60 * 60  # ids never change, names rarely move to another account
+PLAYER_NOT_FOUND_TTL = 60 * 60  # unknown names are retried hourly, the player may sign up
+
+get_player_id_path = "/shards/steam/players?filter[playerNames]="
+get_seasons_path = "/shards/steam/seasons"
+get_season_stats_path = "/shards/steam/players/{player_id}/seasons/{season}?filter[gamepad]=false"
 
 pd.options.display.float_format = "{:,.4f}".format
-headers = {
-    "Authorization": f"Bearer {PUBG_API_KEY}",
-    "Accept": "application/vnd.api+json",
-}
 stats_list = ["damageDealt", "kills", "assists", "headshotKills", "roundMostKills",
               "rideDistance", "top10s", "roundsPlayed", "wins"]
 
 
+pubg_quota = SharedTokenBucket(api_name="pubg", rate=REQUESTS_PER_MINUTE, per=60)
+# Every retry is a real api request, so it takes a token like the first attempt did
+pubg_client = PubgClient(api_key=PUBG_API_KEY, base_url=PUBG_API_URL, timeout=TIMEOUT,
+                         pool_size=NR_OF_BARS, allow_retry=lambda: not pubg_quota.try_acquire())
+pubg_lookup_cache = LookupCache()
+
+
+def get_cooldown_response(drain=False):
+    """
+    Takes drain(bool), True when the api itself answered 429, to empty the shared quota.
+    Returns the 429 status code with the connected flash message.
+    """
+    if drain:
+        pubg_quota.drain()
+    return 429, get_pubg_cooldown_message()
+
+
 def get_player_id(name):
     """
     Takes a player's name (str) and returns the id(str) if success,
     else returns the status code and the connected flash message.
      """
-    response = requests.get(
-        f"{get_player_id_url}{name}",
-        headers=headers,
-        timeout=TIMEOUT,
-    )
+    cache_key = f"player_id:{name}"
+    cached = pubg_lookup_cache.get(cache_key)
+    if cached is not None:
+        return tuple(cached)
+
+    if pubg_quota.try_acquire():
+        return get_cooldown_response()
+
+    response = pubg_client.get("players", f"{get_player_id_path}{name}")
     status_code = response.status_code
     # Successful
     if status_code == 200:
         json_response = response.json()
         player_id = json_response["data"][0]["id"]
+        pubg_lookup_cache.set(cache_key, [status_code, player_id], PLAYER_ID_TTL)
         return status_code, player_id
 
     # Player not found
     if status_code == 404:
+        pubg_lookup_cache.set(cache_key, [status_code, "Player not found!"],
+                              PLAYER_NOT_FOUND_TTL)
         return status_code, "Player not found!"
 
     # Too many requests
     if status_code == 429:
-        update_pubg_api_data()
-        pubg_data = APIData.query.filter_by(api_name="pubg").first()
-        return status_code, f"API on cooldown." \
-                            f" {(pubg_data.last_used + 60) - math.floor(time.time())} seconds left."
+        return get_cooldown_response(drain=True)
 
     # Unexpected error
     return status_code, "Unexpected error."
@@ -62,277 +93,303 @@ def get_seasons():
     Returns a list of all seasons after player-base merge if success,
     else returns the status code and the connected flash message.
      """
-    response = requests.get(
-        get_seasons_url,
-        headers=headers,
-        timeout=TIMEOUT,
-    )
+    valid_seasons = pubg_lookup_cache.get("seasons")
+    if valid_seasons is not None:
+        return 200, valid_seasons
+
+    if pubg_quota.try_acquire():
+        return get_cooldown_response()
+
+    response = pubg_client.get("seasons", get_seasons_path)
     status_code = response.status_code
     # Successful
     if status_code == 200:
         json_response = response.json()
         all_seasons = [x["id"] for x in json_response["data"]]
         valid_seasons = [x for x in all_seasons if "pc-" in x][::-1]
+        pubg_lookup_cache.set("seasons", valid_seasons, SEASONS_TTL)
         return status_code, valid_seasons
 
     # Too many requests
     if status_code == 429:
-        update_pubg_api_data()
-        pubg_data = APIData.query.filter_by(api_name="pubg").first()
-        return status_code, f"API on cooldown." \
-                            f" {(pubg_data.last_used + 60) - math.floor(time.time())} seconds left."
+        return get_cooldown_response(drain=True)
 
     # Unexpected error
     return status_code, "Unexpected error."
 
 
-def get_all_season_stats(player_id, valid_seasons, game_mode):
+async def fetch_season_stats(player_id, season, game_mode, max_wait=MAX_WAIT):
     """
-    Takes the player id(str), valid seasons(list), and game mode(str) and if successful returns
-    a list with individual stats(list),
-    else returns the status code and connected flash message.
-     """
-    assists = []
-    damage = []
-    kills = []
-    headshots = []
-    most_kills = []
-    distance = []
-    top10s = []
-    games = []
-    wins = []
-    seasons = []
-    checked = 0
-
-    # Sleep in case of too many requests
-    for season in valid_seasons:
-        if checked in (7, 15):
-            time.sleep(60)
-        checked += 1
-        response = requests.get(
-            f"https://api.pubg.com/shards/steam/players/{player_id}/seasons/{season}?filter["
-            f"gamepad]=false",
-            headers=headers,
-            timeout=TIMEOUT,
-        )
-        status_code = response.status_code
-        # Successful
-        if status_code == 200:
-            try:
-                data_json = response.json()
-                stats = data_json["data"]["attributes"]["gameModeStats"][game_mode]
-            except KeyError:
-                return status_code, "Internal error!"
-
-            # Too many requests
-        elif response.status_code == 429:
-            update_pubg_api_data()
-            pubg_data = APIData.query.filter_by(api_name="pubg").first()
-            return status_code,\
-                f"API on cooldown." \
-                f"{(pubg_data.last_used + 60) - math.floor(time.time())} seconds left."
-
-        else:
-            # Unexpected error
-            return status_code, "Unexpected error."
-
-        if stats["roundsPlayed"] > 4:
-            assists.append(stats["assists"])
-            damage.append(stats["damageDealt"])
-            kills.append(stats["kills"])
-            headshots.append(stats["headshotKills"])
-            most_kills.append(stats["roundMostKills"])
-            distance.append(stats["rideDistance"])
-            top10s.append(stats["top10s"])
-            games.append(stats["roundsPlayed"])
-            wins.append(stats["wins"])
-            seasons.append("s." + season.split(".")[-1].split("-")[-1])
-            print(f"{season} added")
-        else:
-            print(f"{season} skipped")
-
-        if len(games) == NR_OF_BARS:
-            return status_code, [assists, damage, kills, headshots, most_kills,
-                                 distance, top10s, games, wins, seasons]
+    Takes the player id(str), a season(str), game mode(str) and max_wait(int) in seconds.
+    Waits for quota, then fetches the season with the shared client in a worker thread.
+    Returns the status code(int) and the game mode stats(dict) or error message(str).
+    """
+    if not await pubg_quota.acquire(max_wait=max_wait):
+        return 429, None
+
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(
+        None,
+        pubg_client.get,
+        "season_stats",
+        get_season_stats_path.format(player_id=player_id, season=season),
+    )
+    status_code = response.status_code
+    # Successful
+    if status_code == 200:
+        try:
+            return status_code, response.json()["data"]["attributes"]["gameModeStats"][game_mode]
+        except KeyError:
+            return status_code, "Internal error!"
 
-    # Unexpected error
-    status_code = 404
+    # Too many requests
+    if status_code == 429:
+        pubg_quota.drain()
+        return status_code, None
 
-    return status_code, [assists, damage, kills, headshots, most_kills,
-                         distance, top10s, games, wins, seasons]
+    # Unexpected error
+    return status_code, "Unexpected error."
 
 
-def create_dataframe(player_stats, name, mode):
+async def fetch_all_season_stats(player_id, valid_seasons, game_mode, max_wait=MAX_WAIT):
     """
-    Takes player_stats(list), valid_seasons(list) and game_mode(str).
-    Saves and returns player stats as a df to be used later to create graphs.
+    Takes the player id(str), valid seasons(list), game mode(str) and max_wait(int) in seconds.
+    Fetches seasons concurrently, newest first, never keeping more requests in flight than
+    could still be needed, and stops once NR_OF_BARS seasons with enough games are found.
+    Returns the status code(int) and a list of (season, stats) tuples or error message(str).
     """
-    mode = mode.replace("-", "_")
-    df_player = pd.DataFrame()
-
-    df_player["Season"] = player_stats[9]
-    df_player["Games"] = player_stats[7]
-
-    df_player["Wins"] = player_stats[8]
-    df_player["Wins_g"] = df_player.Wins / df_player.Games
-
-    df_player["Top10s"] = player_stats[8]
-    df_player["Top10s_g"] = df_player.Top10s / df_player.Games
-
-    df_player["Damage"] = player_stats[1]
-    df_player["Damage_g"] = df_player.Damage / df_player.Games
-
-    df_player["Kills"] = player_stats[2]
-    df_player["Kills_g"] = df_player.Kills / df_player.Games
-
-    df_player["Headshots"] = player_stats[3]
-    df_player["Headshots_g"] = df_player.Headshots / df_player.Games
+    pending = {}
+    found = {}
+    next_index = 0
+
+    while True:
+        # Launch only as many requests as could still be needed
+        while len(found) + len(pending) < NR_OF_BARS and next_index < len(valid_seasons):
+            season = valid_seasons[next_index]
+            task = asyncio.create_task(
+                fetch_season_stats(player_id, season, game_mode, max_wait))
+            pending[task] = (next_index, season)
+            next_index += 1
+
+        if not pending:
+            break
+
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            index, season = pending.pop(task)
+            status_code, stats = task.result()
+            if status_code != 200 or isinstance(stats, str):
+                for other in pending:
+                    other.cancel()
+                return status_code, stats
+
+            if stats["roundsPlayed"] > 4:
+                found[index] = (season, stats)
+                print(f"{season} added")
+            else:
+                print(f"{season} skipped")
+
+    seasons_stats = [found[index] for index in sorted(found)]
+    if len(seasons_stats) == NR_OF_BARS:
+        return 200, seasons_stats
+
+    # Ran out of seasons
+    return 404, seasons_stats
+
+
+def get_season_label(season):
+    """
+    Takes a season(str) id such as "division.bro.official.pc-2018-21".
+    Returns the season label(str) shown in the charts, such as "s.21".
+    """
+    return "s." + season.split(".")[-1].split("-")[-1]
 
-    df_player["Assists"] = player_stats[0]
-    df_player["Assists_g"] = df_player.Assists / df_player.Games
 
-    df_player["Most_Kills"] = player_stats[4]
-    df_player["Most_Kills_g"] = df_player.Assists / df_player.Games
+def get_stats_lists(seasons_stats):
+    """
+    Takes a list of (season, stats) tuples.
+    Returns them as player_stats(list), a list per individual stat.
+    """
+    assists = [stats["assists"] for _, stats in seasons_stats]
+    damage = [stats["damageDealt"] for _, stats in seasons_stats]
+    kills = [stats["kills"] for _, stats in seasons_stats]
+    headshots = [stats["headshotKills"] for _, stats in seasons_stats]
+    most_kills = [stats["roundMostKills"] for _, stats in seasons_stats]
+    distance = [stats["rideDistance"] for _, stats in seasons_stats]
+    top10s = [stats["top10s"] for _, stats in seasons_stats]
+    games = [stats["roundsPlayed"] for _, stats in seasons_stats]
+    wins = [stats["wins"] for _, stats in seasons_stats]
+    seasons = [get_season_label(season) for season, _ in seasons_stats]
+
+    return [assists, damage, kills, headshots, most_kills,
+            distance, top10s, games, wins, seasons]
+
+
+def get_all_season_stats(player_id, valid_seasons, game_mode, max_wait=MAX_WAIT):
+    """
+    Takes the player id(str), valid seasons(list), and game mode(str) and if successful returns
+    a list with individual stats(list),
+    else returns the status code and connected flash message.
+    Waits at most max_wait seconds for api quota.
+     """
+    status_code, response = asyncio.run(
+        fetch_all_season_stats(player_id, valid_seasons, game_mode, max_wait))
 
-    df_player["Distance"] = player_stats[5]
-    df_player["Distance_g"] = df_player.Distance / df_player.Games
+    # Too many requests
+    if status_code == 429:
+        return get_cooldown_response()
 
-    df_player.to_csv(f"flasktest/static/data/api/pubg/df_{name}_{mode}.csv", index=False)
+    if isinstance(response, str):
+        return status_code, response
 
-    return df_player
+    remember_checked_season(player_id, valid_seasons, game_mode)
+    return status_code, get_stats_lists(response)
 
 
-def create_kills_bar(dataframe, name, mode):
+def remember_checked_season(player_id, valid_seasons, game_mode):
     """
-    Takes a dataframe, player name(str) and game mode(str).
-    Saves a png of a bar chart from entered data.
-    Returns image location to be rendered.
+    Takes the player id(str), valid seasons(list) and game mode(str) once they are fetched.
+    Saves the newest ended season as checked, so the seasons skipped for having too few games,
+    which are never stored, are not fetched again on every refresh.
     """
-    color = "rgb(20,27,37)"
-    kills_bar = px.bar(
-        data_frame=dataframe,
-        x="Season",
-        y="Kills_g",
-        title=f"Kills per game vs season | {name} {mode}",
-    )
-    kills_bar.update_traces(
-        marker_color=color,
-        marker_line_width=None,
-        opacity=None,
-    )
-
-    kills_bar.update_layout(
-        xaxis_title="Season",
-        yaxis_title="Kills per game",
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font={
-            "family": "Josefin Sans",
-            "size": 17,
-            "color": color,
-        },
-    )
-    kills_bar.write_image("flasktest/static/images/api/pubg/current_kills.png", scale=2)
-    return "../static/images/api/pubg/current_kills.png"
+    if len(valid_seasons) < 2:
+        return
+    cache_key = f"checked_season:{player_id}:{game_mode}"
+    newest_ended = get_season_label(valid_seasons[1])
+    if pubg_lookup_cache.get(cache_key) != newest_ended:
+        pubg_lookup_cache.set(cache_key, newest_ended, CHECKED_SEASON_TTL)
 
 
-def create_damage_bar(dataframe, name, mode):
+def get_live_season_stats(player_id, valid_seasons, game_mode, stored_stats, finalized,
+                          max_wait=MAX_WAIT):
     """
-    Takes a df, player name(str) and game mode(str).
-    Saves a png of a bar chart from entered data.
-    Returns image location to be rendered.
+    Takes the player id(str), valid seasons(list), game mode(str), the stored player_stats(list)
+    and their finalized flags(list).
+    Refetches only the seasons newer than both the newest finalized one and the newest ended
+    season already checked, usually just the live season, and merges them into the stored stats,
+    keeping the newest NR_OF_BARS seasons.
+    Falls back to get_all_season_stats when neither is known.
+    Returns the status code and the merged player_stats(list) or connected flash message.
     """
-    color = "rgb(20,27,37)"
-    damage_bar = px.bar(
-        data_frame=dataframe,
-        x="Season",
-        y="Damage_g",
-        title=f"Damage per game vs season | {name} {mode}",
-    )
-    damage_bar.update_traces(
-        marker_color=color,
-        marker_line_width=None,
-        opacity=None,
-    )
+    labels = [get_season_label(season) for season in valid_seasons]
+    newest_finalized = next((season for season, season_finalized
+                             in zip(stored_stats[9], finalized) if season_finalized), None)
+    checked = pubg_lookup_cache.get(f"checked_season:{player_id}:{game_mode}")
+    known = [labels.index(label) for label in (newest_finalized, checked) if label in labels]
+    if not known:
+        return get_all_season_stats(player_id, valid_seasons, game_mode, max_wait)
+
+    live_seasons = valid_seasons[:min(known)]
+    status_code, response = asyncio.run(
+        fetch_all_season_stats(player_id, live_seasons, game_mode, max_wait))
 
-    damage_bar.update_layout(
-        xaxis_title="Season",
-        yaxis_title="Damage per game",
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font={
-            "family": "Josefin Sans",
-            "size": 17,
-            "color": color,
-        },
-    )
+    # Too many requests
+    if status_code == 429:
+        return get_cooldown_response()
 
-    damage_bar.write_image("flasktest/static/images/api/pubg/current_damage.png", scale=2)
+    if isinstance(response, str):
+        return status_code, response
 
-    return "../static/images/api/pubg/current_damage.png"
+    # Fewer than NR_OF_BARS live seasons is expected here, the stored ones fill the rest
+    live_labels = labels[:len(live_seasons)]
+    kept_stats = [season_stats for season_stats in zip(*stored_stats)
+                  if season_stats[9] in labels and season_stats[9] not in live_labels]
+    merged_stats = sorted([*zip(*get_stats_lists(response)), *kept_stats],
+                          key=lambda season_stats: labels.index(season_stats[9]))[:NR_OF_BARS]
 
+    remember_checked_season(player_id, valid_seasons, game_mode)
+    return 200, [list(column) for column in zip(*merged_stats)]
 
-def create_distance_bar(dataframe, name, mode):
+
+def build_player_dataframe(player_stats):
     """
-    Takes a df, player name(str) and game mode(str).
-    Saves a png of a bar chart from entered data.
-    Returns image location to be rendered.
+    Takes player_stats(list).
+    Returns player stats as a df with per game columns to be used to create graphs.
     """
-    color = "rgb(20,27,37)"
-    distance_bar = px.bar(
-        data_frame=dataframe,
-        x="Season",
-        y="Distance_g",
-        title=f"Distance per game vs season | {name} {mode}",
-    )
-    distance_bar.update_traces(
-        marker_color=color,
-        marker_line_width=None,
-        opacity=None,
-    )
-
-    distance_bar.update_layout(
-        xaxis_title="Season",
-        yaxis_title="Distance per game",
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font={
-            "family": "Josefin Sans",
-            "size": 17,
-            "color": color,
-        },
-    )
-
-    distance_bar.write_image("flasktest/static/images/api/pubg/current_distance.png", scale=2)
-
-    return "../static/images/api/pubg/current_distance.png"
+    df_player = pd.DataFrame({
+        "Season": player_stats[9],
+        "Games": player_stats[7],
+        "Wins": player_stats[8],
+        "Top10s": player_stats[6],
+        "Damage": player_stats[1],
+        "Kills": player_stats[2],
+        "Headshots": player_stats[3],
+        "Assists": player_stats[0],
+        "Most_Kills": player_stats[4],
+        "Distance": player_stats[5],
+    })
+    return add_metric_columns(df_player)
+
+
+def create_dataframe(player_stats, name, game_mode, current_season):
+    """
+    Takes player_stats(list), player name(str), game_mode(str) and the current season(str).
+    Saves the stats in the stats store, every season but the current one as finalized,
+    and returns them as a df to create graphs.
+    """
+    current_label = get_season_label(current_season)
+    finalized = [season != current_label for season in player_stats[9]]
+    write_player_stats(name, game_mode, player_stats, finalized)
+    return build_player_dataframe(player_stats)
 
 
-def load_old_pubg_data(df_path, name, game_mode, save_mode):
+def load_player_dataframe(name, game_mode):
     """
-    Used to load local record. Takes request form params and returns the bar charts.
+    Takes a player name(str) and game_mode(str).
+    Returns the stored stats as a df and the time(int) they were fetched,
+    else returns None, None if the player is not stored.
     """
-    old_df = pd.read_csv(f"{df_path}{name}_{save_mode}.csv")
-    kills_img = create_kills_bar(old_df, name, game_mode)
-    damage_img = create_damage_bar(old_df, name, game_mode)
-    distance_img = create_distance_bar(old_df, name, game_mode)
-
-    return kills_img, damage_img, distance_img
+    player_stats, fetched, _ = read_player_stats(name, game_mode)
+    if player_stats is None:
+        return None, None
+    return build_player_dataframe(player_stats), fetched
 
 
-def update_pubg_api_data():
+def render_player_charts(dataframe, name, mode, metrics=PLAYER_CHART_METRICS):
     """
-    Records the time of api request limit to check against when making a new request.
+    Takes a dataframe, player name(str), game mode(str) and metrics(tuple) such as
+    ("kills", "damage", "wins"), each charted from its per game column.
+    Renders every chart not already cached in one batch, exported concurrently.
+    Returns a dict of metric(str): image location(str) to be rendered.
     """
-    pubg_data = APIData.query.filter_by(api_name="pubg").first()
-    pubg_data.last_used = math.floor(time.time())
-    db.session.commit()
+    dataframe_hash = hash_dataframe(dataframe)
+    extension = get_chart_extension()
+    locations = {metric: get_chart_location(dataframe_hash, name, mode, metric, extension)
+                 for metric in metrics}
+
+    def render(metric):
+        column, metric_name = get_metric_chart(metric)
+        save_chart(locations[metric][0], lambda path: render_bar_chart(
+            dataframe,
+            x="Season",
+            y=column,
+            title=f"{metric_name} per game vs season | {name} {mode}",
+            xaxis_title="Season",
+            yaxis_title=f"{metric_name} per game",
+            path=path,
+        ))
+
+    missing = [metric for metric, (chart_path, _) in locations.items()
+               if not is_chart_cached(chart_path)]
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            # list() re-raises any render error here
+            list(executor.map(render, missing))
+
+    return {metric: chart_url for metric, (_, chart_url) in locations.items()}
+
+
+def load_old_pubg_data(old_df, name, game_mode):
+    """
+    Used to load local record. Takes a stored df and request form params and returns the bar charts.
+    """
+    charts = render_player_charts(old_df, name, game_mode)
+
+    return charts["kills"], charts["damage"], charts["distance"]
 
 
 def get_pubg_cooldown_message():
     """
     Returns a string containing the api cooldown timer and the connected flash message.
     """
-    pubg_data = APIData.query.filter_by(api_name="pubg").first()
-
-    return f"API on cooldown. {(pubg_data.last_used + 60) - math.floor(time.time())} seconds left."
+    return f"API on cooldown. {pubg_quota.get_status()['next_in']} seconds left."
@@ -0,0 +1,140 @@
+"""
+Bitset index over the wordle dictionary, used to answer hint requests.
+Every word has a bit, and each (position, letter) and (letter, at least n copies) pair has an
+int with the bits of the words matching it set, so the feedback of a game so far reduces the
+candidate set with a handful of bitwise ANDs.
+"""
+
+import random
+import string
+
+import numpy as np
+
+from flasktest.games.scoring import WORD_LENGTH, PATTERN_COUNT, GREY, GREEN
+
+SAMPLE_SIZE = 10  # candidate words returned with a hint
+GUESS_POOL = 200  # candidates considered when picking the best next guess
+MATRIX_LIMIT = 200  # at most this many candidates are ranked with the pattern matrix
+
+
+def to_bitset(flags):
+    """
+    Takes a 1-D bool array with one flag per word.
+    Returns an int with bit i set when word i is flagged.
+    """
+    return int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+
+
+def count_bits(bitset):
+    """
+    Takes a bitset(int).
+    Returns the number(int) of bits set.
+    """
+    return bin(bitset).count("1")
+
+
+class CandidateIndex:
+    """
+    Class containing the bitsets of a dictionary of words of equal length.
+    """
+    def __init__(self, words, patterns=None):
+        self.words = [word.lower() for word in words]
+        self.patterns = patterns  # optional PatternMatrix over the same words
+        self.all = (1 << len(self.words)) - 1
+
+        letters = np.array([list(word) for word in self.words])
+        self.at_position = [{letter: to_bitset(letters[:, position] == letter)
+                             for letter in string.ascii_lowercase}
+                            for position in range(WORD_LENGTH)]
+        copies = {letter: (letters == letter).sum(axis=1) for letter in string.ascii_lowercase}
+        # at_least[letter][n] holds the words with n or more copies of the letter
+        self.at_least = {letter: [self.all] + [to_bitset(copies[letter] >= count)
+                                               for count in range(1, WORD_LENGTH + 1)]
+                         for letter in string.ascii_lowercase}
+
+    def __repr__(self):
+        return f"CandidateIndex(words={len(self.words)})"
+
+    def filter(self, guess, mask, candidates=None):
+        """
+        Takes a guess(str), its color mask(str) and the candidates(int) bitset so far.
+        Returns the bitset(int) of the candidates that would have given the same colors.
+        """
+        candidates = self.all if candidates is None else candidates
+        guess = guess.lower()
+        marked = {}
+        capped = set()
+        for position, (letter, color) in enumerate(zip(guess, mask)):
+            color = int(color)
+            if color == GREEN:
+                candidates &= self.at_position[position][letter]
+            else:
+                candidates &= ~self.at_position[position][letter]
+
+            if color == GREY:
+                # No copies of the letter beyond the ones marked green or yellow
+                capped.add(letter)
+            else:
+                marked[letter] = marked.get(letter, 0) + 1
+
+        for letter in set(guess):
+            count = marked.get(letter, 0)
+            candidates &= self.at_least[letter][count]
+            if letter in capped:
+                candidates &= ~self.at_least[letter][count + 1]
+        return candidates
+
+    def get_indices(self, candidates):
+        """
+        Takes a candidates(int) bitset.
+        Returns a 1-D array with the index of every candidate word, in dictionary order.
+        """
+        raw = candidates.to_bytes((len(self.words) + 7) // 8, "little")
+        bits = np.unpackbits(np.frombuffer(raw, dtype=np.uint8), bitorder="little")
+        return np.flatnonzero(bits[:len(self.words)])
+
+    def best_guess(self, candidates, indices):
+        """
+        Takes a candidates(int) bitset and their indices(array).
+        Returns the candidate word(str) expected to narrow the rest down the most,
+        ranked by the pattern matrix when it is built and few candidates are left,
+        else by how many candidates share its letters.
+        """
+        if len(indices) == 0:
+            return None
+
+        if self.patterns is not None and self.patterns.matrix is not None \
+                and len(indices) <= MATRIX_LIMIT:
+            patterns = np.asarray(self.patterns.matrix[np.ix_(indices, indices)], dtype=np.int64)
+            offsets = np.arange(len(indices))[:, None] * PATTERN_COUNT
+            buckets = np.bincount((patterns + offsets).ravel(),
+                                  minlength=len(indices) * PATTERN_COUNT)
+            # Expected number of candidates left after each guess, times len(indices)
+            remaining = (buckets.reshape(len(indices), PATTERN_COUNT) ** 2).sum(axis=1)
+            return self.words[indices[int(np.argmin(remaining))]]
+
+        frequency = {letter: count_bits(candidates & self.at_least[letter][1])
+                     for letter in string.ascii_lowercase}
+        if len(indices) > GUESS_POOL:
+            indices = indices[random.sample(range(len(indices)), GUESS_POOL)]
+        return max((self.words[index] for index in indices),
+                   key=lambda word: sum(frequency[letter] for letter in set(word)))
+
+    def get_hint(self, guesses, color_mask):
+        """
+        Takes the packed guesses(str) of a game and their color mask(str).
+        Returns a dict with the number of words still possible, a random sample of them
+        and the best next guess.
+        """
+        candidates = self.all
+        for start in range(0, len(guesses), WORD_LENGTH):
+            candidates = self.filter(guesses[start:start + WORD_LENGTH],
+                                     color_mask[start:start + WORD_LENGTH], candidates)
+
+        indices = self.get_indices(candidates)
+        sample = indices[random.sample(range(len(indices)), min(SAMPLE_SIZE, len(indices)))]
+        return {
+            "candidates": len(indices),
+            "sample": sorted(self.words[index] for index in sample),
+            "best_guess": self.best_guess(candidates, indices),
+        }
@@ -0,0 +1,270 @@
+"""
+Leaderboards for the games.
+The numbers page boards are kept in memory. The global board is a bounded heap of the best
+times, updated when a game finishes and reloaded from the indexed NumbersData table once it
+is older than LEADERBOARD_TTL, so games finished by other worker processes show up too.
+Personal boards are cached per user.
+The daily, weekly and all-time boards keep each users best score per time bucket in the
+LeaderboardScore table, upserted on every write, so reading a page never scans game history.
+"""
+
+import heapq
+import math
+import threading
+import time
+
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+
+from sqlalchemy import select, delete, insert, and_, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from flasktest import app, db
+from flasktest.models import User, CountriesData, NumbersData, LeaderboardScore
+
+LEADERBOARD_SIZE = 8  # times shown on the numbers page
+LEADERBOARD_TTL = 10  # seconds before a board is reloaded from the database
+PERSONAL_BOARDS = 1024  # personal boards kept in memory
+PERIODS = ("day", "week", "all")
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# game: True(bool) when a lower score ranks higher
+leaderboard_games = {"numbers": True, "countries": False}
+
+Score = namedtuple("Score", ["numbers_time", "id", "user_id"])
+
+
+def select_best_times(user_id=None, size=LEADERBOARD_SIZE):
+    """
+    Takes a user_id(int), None for every user, and size(int).
+    Returns the select statement for the best finished times, served by the numbers indexes.
+    """
+    query = select(NumbersData.numbers_time, NumbersData.id, NumbersData.user_id)\
+        .where(NumbersData.numbers_time > 0)
+    if user_id is not None:
+        query = query.where(NumbersData.user_id == user_id)
+    return query.order_by(NumbersData.numbers_time).limit(size)
+
+
+class NumbersLeaderboard:
+    """
+    Class containing the global top times heap and the cached personal boards.
+    """
+    def __init__(self, size=LEADERBOARD_SIZE, ttl=LEADERBOARD_TTL,
+                 max_personal=PERSONAL_BOARDS):
+        self.size = size
+        self.ttl = ttl
+        self.max_personal = max_personal
+        self.heap = []  # (-numbers_time, -id, Score), the slowest of the best times on top
+        self.loaded = 0
+        self.personal = OrderedDict()  # user_id: (loaded, list of Scores)
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"NumbersLeaderboard(size={self.size}, personal={len(self.personal)})"
+
+    def push(self, heap, score):
+        """
+        Takes a heap(list) and a score(Score) and keeps the score if it is among the best.
+        """
+        if any(entry[2].id == score.id for entry in heap):
+            return
+
+        entry = (-score.numbers_time, -score.id, score)
+        if len(heap) < self.size:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def load(self, user_id=None):
+        """
+        Takes a user_id(int), None for the global board.
+        Returns the board's best times as a list of Scores, read from the database.
+        """
+        rows = db.session.execute(select_best_times(user_id, self.size)).all()
+        return [Score(*row) for row in rows]
+
+    def get_global(self):
+        """
+        Returns the best times of all users as a list of Scores, fastest first.
+        """
+        if self.loaded + self.ttl < time.time():
+            scores = self.load()
+            with self.lock:
+                self.heap = []
+                for score in scores:
+                    self.push(self.heap, score)
+                self.loaded = time.time()
+
+        with self.lock:
+            return [entry[2] for entry in sorted(self.heap, reverse=True)]
+
+    def get_personal(self, user_id):
+        """
+        Takes a user_id(int).
+        Returns the user's best times as a list of Scores, fastest first.
+        """
+        with self.lock:
+            cached = self.personal.get(user_id)
+            if cached and cached[0] + self.ttl >= time.time():
+                self.personal.move_to_end(user_id)
+                return cached[1]
+
+        scores = self.load(user_id)
+        with self.lock:
+            self.personal[user_id] = (time.time(), scores)
+            self.personal.move_to_end(user_id)
+            while len(self.personal) > self.max_personal:
+                self.personal.popitem(last=False)
+        return scores
+
+    def record(self, score):
+        """
+        Takes the score(Score) of a finished game and adds it to the boards it belongs on.
+        """
+        with self.lock:
+            if self.loaded:
+                self.push(self.heap, score)
+
+            cached = self.personal.get(score.user_id)
+            if cached:
+                personal = [(-old.numbers_time, -old.id, old) for old in cached[1]]
+                heapq.heapify(personal)
+                self.push(personal, score)
+                self.personal[score.user_id] = (
+                    cached[0], [entry[2] for entry in sorted(personal, reverse=True)])
+
+
+numbers_leaderboard = NumbersLeaderboard()
+
+
+# -windowed leaderboards-------------------------------------------- #
+def get_bucket(period, timestamp):
+    """
+    Takes a period(str) and a timestamp(float).
+    Returns the bucket(str) the timestamp falls in, such as 2023-03-14, 2023-W11 or all (UTC).
+    """
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    if period == "day":
+        return moment.strftime("%Y-%m-%d")
+    if period == "week":
+        year, week, _ = moment.isocalendar()
+        return f"{year}-W{week:02}"
+    return "all"
+
+
+def record_score(game, user_id, score, timestamp=None):
+    """
+    Takes a game(str), user_id(int), score(float) and the timestamp(float) it was achieved.
+    Keeps it as the users best in the current day, week and all-time buckets, in one upsert
+    that is committed with the callers own changes.
+    """
+    timestamp = timestamp or time.time()
+    statement = sqlite_insert(LeaderboardScore).values([
+        {"game": game, "period": period, "bucket": get_bucket(period, timestamp),
+         "user_id": user_id, "score": score, "achieved": timestamp}
+        for period in PERIODS
+    ])
+    if leaderboard_games[game]:
+        better = statement.excluded.score < LeaderboardScore.score
+    else:
+        better = statement.excluded.score > LeaderboardScore.score
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=["game", "period", "bucket", "user_id"],
+        set_={"score": statement.excluded.score, "achieved": statement.excluded.achieved},
+        where=better,
+    ))
+
+
+def get_leaderboard_page(game, period, bucket=None, limit=PAGE_SIZE, after=None):
+    """
+    Takes a game(str), period(str), bucket(str), defaulting to the current one, a page
+    limit(int) and the after(str) cursor returned with the previous page.
+    Returns the page(dict) to be sent as json. Pages are read straight off the rank index,
+    continuing after the cursor instead of skipping rows, so deep pages are as cheap as the first.
+    Raises ValueError for a malformed cursor.
+    """
+    lower_better = leaderboard_games[game]
+    bucket = bucket or get_bucket(period, time.time())
+    query = select(LeaderboardScore.score, LeaderboardScore.user_id, User.username)\
+        .join(User, User.id == LeaderboardScore.user_id)\
+        .where(LeaderboardScore.game == game,
+               LeaderboardScore.period == period,
+               LeaderboardScore.bucket == bucket)
+
+    rank = 0
+    if after:
+        rank, score, user_id = after.split(":")
+        rank, score, user_id = int(rank), float(score), int(user_id)
+        # float() takes nan and inf too, nan compares false with every score and skips the rest
+        if not math.isfinite(score) or rank < 0:
+            raise ValueError(f"Malformed leaderboard cursor {after}")
+        if lower_better:
+            beyond = LeaderboardScore.score > score
+        else:
+            beyond = LeaderboardScore.score < score
+        query = query.where(or_(beyond, and_(LeaderboardScore.score == score,
+                                             LeaderboardScore.user_id > user_id)))
+
+    order = LeaderboardScore.score.asc() if lower_better else LeaderboardScore.score.desc()
+    rows = db.session.execute(
+        query.order_by(order, LeaderboardScore.user_id).limit(limit + 1)).all()
+
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = f"{rank + limit}:{last.score!r}:{last.user_id}"
+
+    return {
+        "game": game,
+        "period": period,
+        "bucket": bucket,
+        "entries": [{"rank": rank + position + 1, "username": row.username, "score": row.score}
+                    for position, row in enumerate(page)],
+        "next": next_cursor,
+    }
+
+
+def rebuild_leaderboards():
+    """
+    Recomputes every bucket from the game history, for data recorded before the
+    leaderboards existed. Countries only keep each users record, so their daily and weekly
+    boards start empty.
+    Returns the number(int) of scores saved.
+    """
+    best = {}
+    finished = db.session.execute(
+        select(NumbersData.user_id, NumbersData.numbers_time, NumbersData.numbers_stop)
+        .where(NumbersData.numbers_time > 0))
+    for user_id, numbers_time, stopped in finished:
+        for period in PERIODS:
+            key = ("numbers", period, get_bucket(period, stopped), user_id)
+            if key not in best or numbers_time < best[key][0]:
+                best[key] = (numbers_time, stopped)
+
+    now = time.time()
+    records = db.session.execute(
+        select(CountriesData.user_id, CountriesData.country_record)
+        .where(CountriesData.country_record > 0))
+    for user_id, country_record in records:
+        best[("countries", "all", "all", user_id)] = (country_record, now)
+
+    db.session.execute(delete(LeaderboardScore))
+    if best:
+        db.session.execute(insert(LeaderboardScore), [
+            {"game": game, "period": period, "bucket": bucket, "user_id": user_id,
+             "score": score, "achieved": achieved}
+            for (game, period, bucket, user_id), (score, achieved) in best.items()
+        ])
+    db.session.commit()
+    return len(best)
+
+
+@app.cli.command("rebuild-leaderboards")
+def rebuild_leaderboards_command():
+    """
+    Recomputes the daily, weekly and all-time leaderboards from the game history.
+    """
+    print(f"Saved {rebuild_leaderboards()} leaderboard scores.")
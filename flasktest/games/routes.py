@@ -1,14 +1,13 @@
-import time
-
-from flask import render_template, request, session
+from flask import render_template, request, session, jsonify
 from flask_login import login_required
 
-from flasktest import db
-from flasktest.models import CountriesData, WordleData, NumbersData, start_new_wordle,\
-    play_wordle_game, get_last_wordle_guess
+from flasktest.models import start_new_wordle, play_wordle_game, get_wordle_board, \
+    get_countries_data, get_wordle_data
 from flasktest.games.forms import CountryForm, WordleForm, NumbersForm
-from flasktest.games.utils import get_country_name, get_country_size, get_country_path,\
-    evaluate_countries_game, create_numbers_divs
+from flasktest.games.leaderboard import numbers_leaderboard, leaderboard_games, PERIODS, \
+    PAGE_SIZE, MAX_PAGE_SIZE, get_leaderboard_page
+from flasktest.games.utils import get_country, evaluate_countries_game, create_numbers_divs, \
+    wordle_hints, start_numbers_game, stop_numbers_game
 
 from flask import Blueprint
 
@@ -19,17 +18,20 @@ games = Blueprint("games", __name__)
 @login_required
 def countries():
     country_form = CountryForm()
-    countries_data = CountriesData.query.filter_by(user_id=session["id"]).first()
+    # Loaded together with the user, see load_request_user
+    countries_data = get_countries_data(session["id"])
 
     if request.method == "GET":
+        country_old = get_country(countries_data.country_old)
+        country_new = get_country(countries_data.country_new)
         return render_template("/games/countries.html",
                                country_form=country_form,
-                               name1=get_country_name(countries_data.country_old),
-                               size1=get_country_size(countries_data.country_old),
-                               path1=get_country_path(countries_data.country_old),
-                               name2=get_country_name(countries_data.country_new),
-                               size2=get_country_size(countries_data.country_new),
-                               path2=get_country_path(countries_data.country_new),
+                               name1=country_old.name,
+                               size1=country_old.size,
+                               path1=country_old.path,
+                               name2=country_new.name,
+                               size2=country_new.size,
+                               path2=country_new.path,
                                country_streak=countries_data.country_streak,
                                page="countries",
                                country_record=countries_data.country_record)
@@ -37,15 +39,17 @@ def countries():
     if country_form.validate_on_submit():
         guess = country_form.select.data
         countries_data = evaluate_countries_game(guess=guess, user_id=session["id"])
+        country_old = get_country(countries_data.country_old)
+        country_new = get_country(countries_data.country_new)
 
         return render_template("/games/countries.html",
                                country_form=country_form,
-                               name1=get_country_name(countries_data.country_old),
-                               size1=get_country_size(countries_data.country_old),
-                               path1=get_country_path(countries_data.country_old),
-                               name2=get_country_name(countries_data.country_new),
-                               size2=get_country_size(countries_data.country_new),
-                               path2=get_country_path(countries_data.country_new),
+                               name1=country_old.name,
+                               size1=country_old.size,
+                               path1=country_old.path,
+                               name2=country_new.name,
+                               size2=country_new.size,
+                               path2=country_new.path,
                                country_streak=countries_data.country_streak,
                                country_record=countries_data.country_record,
                                page="countries",
@@ -62,9 +66,8 @@ def wordle():
 @login_required
 def play_wordle():
     wordle_form = WordleForm()
-    # Get the users last played game
-    descending = WordleData.query.order_by(WordleData.id.desc())
-    wordle_data = descending.filter_by(user_id=session["id"]).first()
+    # Get the users last played game, loaded together with the user
+    wordle_data = get_wordle_data(session["id"])
 
     # No games played yet
     if not wordle_data:
@@ -97,10 +100,9 @@ def play_wordle():
                                page="play_wordle")
 
     # GET request
-    # Need last guessed word to recreate game state
-    last_wordle_guess = get_last_wordle_guess(wordle_data=wordle_data)
-    game_state, wordle_divs = play_wordle_game(wordle_guess=last_wordle_guess,
-                                               user_id=session["id"])
+    # Recreate the board from the stored guesses and colors
+    game_state = wordle_data.wordle_game_state
+    wordle_divs = get_wordle_board(wordle_data=wordle_data)
 
     return render_template("games/play_wordle.html",
                            wordle_form=wordle_form,
@@ -109,88 +111,53 @@ def play_wordle():
                            page="play_wordle")
 
 
+@games.route("/games/wordle/hint")
+@login_required
+def wordle_hint():
+    # Get the users last played game, loaded together with the user
+    wordle_data = get_wordle_data(session["id"])
+    if not wordle_data or wordle_data.wordle_game_state != "busy":
+        return jsonify({"error": "No active game"}), 404
+
+    # Narrow the dictionary down with the colors the user has seen so far
+    hint = wordle_hints.get_hint(wordle_data.wordle_guesses, wordle_data.wordle_colors)
+    hint["round"] = wordle_data.wordle_round
+    return jsonify(hint)
+
+
 @games.route("/games/numbers", methods=["POST", "GET"])
 @login_required
 def numbers():
     numbers_form = NumbersForm()
     numbers_divs = create_numbers_divs()
 
-    # Get users last unfinished game
-    numbers_data = db.session.query(NumbersData)\
-        .order_by(NumbersData.id.desc())\
-        .filter(NumbersData.user_id == session["id"])\
-        .first()
-    # Get best times global
-    numbers_highscores_all = db.session.query(NumbersData)\
-        .order_by(NumbersData.numbers_time)\
-        .filter(NumbersData.numbers_time > 0).limit(8)\
-        .all()
-    # Get best times personal
-    numbers_highscores_self = db.session.query(NumbersData)\
-        .order_by(NumbersData.numbers_time)\
-        .filter(NumbersData.numbers_time > 0, NumbersData.user_id == session["id"]).limit(8)\
-        .all()
-
-    # Never played before
-    if numbers_data is None:
-        new_numbers = NumbersData(
-            user_id=session["id"],
-            numbers_start=time.time(),
-        )
-        db.session.add(new_numbers)
-        db.session.commit()
-        return render_template("/games/numbers.html",
-                               numbers_form=numbers_form,
-                               numbers_divs=numbers_divs,
-                               numbers_highscores_self=numbers_highscores_self,
-                               numbers_highscores_all=numbers_highscores_all,
-                               page="numbers",
-                               )
-
-    # Played before and last game is over
-    if numbers_data.numbers_time != -1:
-        new_numbers = NumbersData(
-            user_id=session["id"],
-            numbers_start=time.time(),
-        )
-        db.session.add(new_numbers)
-        db.session.commit()
-        return render_template("/games/numbers.html",
-                               numbers_form=numbers_form,
-                               numbers_divs=numbers_divs,
-                               numbers_highscores_self=numbers_highscores_self,
-                               numbers_highscores_all=numbers_highscores_all,
-                               page="numbers",
-                               )
-
-    # Game is going on pressed stop
-    if numbers_form.validate_on_submit():
-        numbers_data.numbers_stop = time.time()
-        numbers_data.numbers_time = round((numbers_data.numbers_stop - numbers_data.numbers_start),
-                                          4)
-        db.session.commit()
-        return render_template("/games/numbers.html",
-                               numbers_form=numbers_form,
-                               numbers_divs=numbers_divs,
-                               numbers_highscores_self=numbers_highscores_self,
-                               numbers_highscores_all=numbers_highscores_all,
-                               page="numbers",
-                               )
-
-    # Game is going on and restarted
-    if numbers_data.numbers_stop == -1:
-        db.session.delete(numbers_data)
-        db.session.commit()
-        new_numbers = NumbersData(
-            user_id=session["id"],
-            numbers_start=time.time(),
-        )
-        db.session.add(new_numbers)
-        db.session.commit()
-        return render_template("/games/numbers.html",
-                               numbers_form=numbers_form,
-                               numbers_divs=numbers_divs,
-                               numbers_highscores_self=numbers_highscores_self,
-                               numbers_highscores_all=numbers_highscores_all,
-                               page="numbers",
-                               )
+    # Game is going on pressed stop, else start a new game or restart the unfinished one
+    if not (numbers_form.validate_on_submit() and stop_numbers_game(session["id"])):
+        start_numbers_game(session["id"])
+
+    # Best times global and personal, read after any new time is saved
+    return render_template("/games/numbers.html",
+                           numbers_form=numbers_form,
+                           numbers_divs=numbers_divs,
+                           numbers_highscores_self=numbers_leaderboard.get_personal(session["id"]),
+                           numbers_highscores_all=numbers_leaderboard.get_global(),
+                           page="numbers",
+                           )
+
+
+@games.route("/games/leaderboards/<game>")
+@login_required
+def leaderboard(game):
+    period = request.args.get("period", "all")
+    if game not in leaderboard_games or period not in PERIODS:
+        return jsonify({"error": "Leaderboard not found"}), 404
+
+    limit = min(max(request.args.get("limit", PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    try:
+        page = get_leaderboard_page(game, period,
+                                    bucket=request.args.get("bucket"),
+                                    limit=limit,
+                                    after=request.args.get("after"))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    return jsonify(page)
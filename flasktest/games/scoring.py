@@ -0,0 +1,168 @@
+"""
+Wordle scoring engine.
+The feedback for a guess is encoded as a base-3 integer pattern, one digit per letter
+(0 grey, 1 yellow, 2 green, the first letter being the lowest digit), so the 243 possible
+patterns fit in a uint8. PatternMatrix precomputes the pattern of every guess against every
+answer in the dictionary, turning scoring into a table lookup.
+By default there is no matrix and every guess is scored by score_pattern, about 1.2M scores per
+second. The matrix takes seconds to build and 33 MB, so it is only used once saved by
+flask build-wordle-patterns, memory mapped and shared by the workers. It is never built on demand
+while serving.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+GREY, YELLOW, GREEN = 0, 1, 2
+WORD_LENGTH = 5
+PATTERN_COUNT = 3 ** WORD_LENGTH
+BUILD_CHUNK = 256  # guesses scored per vectorized step when building the matrix
+
+powers = 3 ** np.arange(WORD_LENGTH, dtype=np.uint8)
+green_weights = tuple(GREEN * 3 ** position for position in range(WORD_LENGTH))
+yellow_weights = tuple(YELLOW * 3 ** position for position in range(WORD_LENGTH))
+# The color mask of every pattern, as returned by pattern_to_mask
+masks = tuple("".join(str(pattern // 3 ** position % 3) for position in range(WORD_LENGTH))
+              for pattern in range(PATTERN_COUNT))
+
+
+def score_pattern(guess, answer):
+    """
+    Takes a guess(str) and an answer(str) of the same case.
+    Returns the feedback pattern(int). Greens are given first, then each yellow uses up
+    one unmatched copy of its letter, so repeated letters are never over-reported.
+    """
+    if guess == answer:
+        return PATTERN_COUNT - 1
+
+    pattern = 0
+    # The answer letters left for yellows, removing any copy of a green letter counts the same
+    unmatched = answer
+    for guess_letter, answer_letter, weight in zip(guess, answer, green_weights):
+        if guess_letter == answer_letter:
+            pattern += weight
+            unmatched = unmatched.replace(guess_letter, "", 1)
+
+    for guess_letter, answer_letter, weight in zip(guess, answer, yellow_weights):
+        if guess_letter != answer_letter and guess_letter in unmatched:
+            pattern += weight
+            unmatched = unmatched.replace(guess_letter, "", 1)
+    return pattern
+
+
+def pattern_to_mask(pattern, word_length=WORD_LENGTH):
+    """
+    Takes a pattern(int).
+    Returns the color mask(str), one digit per letter as stored with a wordle game.
+    """
+    if word_length == WORD_LENGTH:
+        return masks[pattern]
+    mask = ""
+    for _ in range(word_length):
+        pattern, color = divmod(pattern, 3)
+        mask += str(color)
+    return mask
+
+
+def mask_to_pattern(mask):
+    """
+    Takes a color mask(str).
+    Returns its pattern(int).
+    """
+    return sum(int(color) * 3 ** index for index, color in enumerate(mask))
+
+
+def encode_words(words):
+    """
+    Takes a sequence of words(str).
+    Returns a 2-D uint8 array of letter codes, one row per word.
+    """
+    return np.frombuffer("".join(words).lower().encode("ascii"), dtype=np.uint8)\
+        .reshape(-1, WORD_LENGTH) - ord("a")
+
+
+def score_patterns(guesses, answers):
+    """
+    Takes the letter codes of guesses and answers, as returned by encode_words.
+    Returns a 2-D uint8 array with the pattern of every guess against every answer.
+    """
+    guesses = guesses[:, None, :]
+    answers = answers[None, :, :]
+    greens = guesses == answers
+
+    patterns = np.zeros(greens.shape[:2], dtype=np.uint8)
+    yellows = []
+    for position in range(WORD_LENGTH):
+        letter = guesses[:, :, position]
+        # Copies of the letter in the answer not matched green, nor by an earlier yellow
+        available = sum((answers[:, :, other] == letter) & ~greens[:, :, other]
+                        for other in range(WORD_LENGTH))
+        used = sum(yellows[earlier] & (guesses[:, :, earlier] == letter)
+                   for earlier in range(position))
+        yellows.append(~greens[:, :, position] & (available > used))
+        patterns += greens[:, :, position] * powers[position] * GREEN
+        patterns += yellows[position] * powers[position]
+    return patterns
+
+
+class PatternMatrix:
+    """
+    Class containing the pattern of every dictionary word guessed against every other.
+    The matrix is built by build or save, which saves it to cache_dir named after a hash of the
+    dictionary, and memory mapped on later starts.
+    """
+    def __init__(self, words, cache_dir=None):
+        self.words = [word.lower() for word in words]
+        self.index = {word: position for position, word in enumerate(self.words)}
+        self.path = None
+        self.matrix = None
+        if cache_dir:
+            words_hash = hashlib.sha1("".join(self.words).encode("ascii")).hexdigest()[:12]
+            self.path = os.path.join(cache_dir, f"wordle_patterns_{words_hash}.npy")
+            if os.path.exists(self.path):
+                self.load()
+
+    def __repr__(self):
+        return f"PatternMatrix(words={len(self.words)}, built={self.matrix is not None})"
+
+    def build(self):
+        """
+        Scores every word against every other in vectorized chunks.
+        Returns the matrix, a 2-D uint8 array indexed [guess, answer].
+        """
+        codes = encode_words(self.words)
+        matrix = np.empty((len(codes), len(codes)), dtype=np.uint8)
+        for start in range(0, len(codes), BUILD_CHUNK):
+            matrix[start:start + BUILD_CHUNK] = score_patterns(codes[start:start + BUILD_CHUNK],
+                                                               codes)
+        self.matrix = matrix
+        return matrix
+
+    def save(self):
+        """
+        Builds the matrix if needed and saves it to path as a .npy file.
+        """
+        if self.matrix is None:
+            self.build()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        np.save(self.path, self.matrix)
+
+    def load(self):
+        """
+        Memory maps the saved matrix.
+        """
+        self.matrix = np.load(self.path, mmap_mode="r")
+
+    def pattern(self, guess, answer):
+        """
+        Takes a guess(str) and an answer(str).
+        Returns their pattern(int), looked up in the matrix when it is built and both are
+        dictionary words, else scored directly.
+        """
+        guess = guess.lower()
+        answer = answer.lower()
+        if self.matrix is not None and guess in self.index and answer in self.index:
+            return int(self.matrix[self.index[guess], self.index[answer]])
+        return score_pattern(guess, answer)
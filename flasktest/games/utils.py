@@ -1,22 +1,61 @@
+import os
 import pandas as pd
 import random
+import time
 
-from flasktest import db
-from flasktest.models import CountriesData
+from collections import namedtuple
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from flasktest import app, db
+from flasktest.models import NumbersData, get_countries_data
+from flasktest.games.scoring import PatternMatrix, pattern_to_mask
+from flasktest.games.hints import CandidateIndex
+from flasktest.games.leaderboard import Score, record_score, numbers_leaderboard
 
 df_europe_path = "flasktest/static/data/games/countries/df_europe.csv"
 wordle_words_path = "flasktest/static/data/games/wordle/5_letter_words.csv"
+WORDLE_CACHE_DIR = "flasktest/cache"
 
 
 # ####### Countries ####### #
+Country = namedtuple("Country", ["name", "size", "path"])
+
+# Parsed once and shared by every request, reloaded when df_europe changes on disk
+country_catalog = {"mtime": None, "countries": ()}
+
+
+def load_country_catalog():
+    """
+    Parses df_europe into an immutable tuple of Country records.
+    Only re-reads the csv when its modification time has changed.
+    Returns the countries(tuple) indexed by country number.
+    """
+    mtime = os.path.getmtime(df_europe_path)
+    if country_catalog["mtime"] != mtime:
+        df_europe = pd.read_csv(df_europe_path)
+        country_catalog["countries"] = tuple(
+            Country(name, int(size), path)
+            for name, size, path in zip(df_europe.Name, df_europe.Size, df_europe.FilePath)
+        )
+        country_catalog["mtime"] = mtime
+    return country_catalog["countries"]
+
+
+def get_country(number):
+    """
+    Takes a number(int) to compare to df_europe.
+    Returns the Country(namedtuple) with its name, size and image location.
+    """
+    return load_country_catalog()[number]
+
+
 def get_country_name(number):
     """
     Takes a number(int) to compare to df_europe.
     Returns the name(str) of the country.
     """
-    df_europe = pd.read_csv(df_europe_path)
-    countries = df_europe.Name.tolist()
-    return countries[number]
+    return get_country(number).name
 
 
 def get_country_size(number):
@@ -24,9 +63,7 @@ def get_country_size(number):
     Takes a number(int) to compare to df_europe.
     Returns the size(int) of the country in square km.
     """
-    df_europe = pd.read_csv(df_europe_path)
-    sizes = df_europe.Size.tolist()
-    return int(sizes[number])
+    return get_country(number).size
 
 
 def get_country_path(number):
@@ -34,9 +71,7 @@ def get_country_path(number):
     Takes a number(int) to compare to df_europe.
     Returns the location(str) of the country's image.
     """
-    df_europe = pd.read_csv(df_europe_path)
-    paths = df_europe.FilePath.tolist()
-    return paths[number]
+    return get_country(number).path
 
 
 def evaluate_countries_game(guess, user_id):
@@ -45,21 +80,23 @@ def evaluate_countries_game(guess, user_id):
     Compares country sizes and updates db.
     Returns countries_data.
     """
-    countries_data = CountriesData.query.filter_by(user_id=user_id).first()
-    size_old = int(get_country_size(countries_data.country_old))
-    size_new = int(get_country_size(countries_data.country_new))
+    countries_data = get_countries_data(user_id)
+    size_old = get_country(countries_data.country_old).size
+    size_new = get_country(countries_data.country_new).size
 
     if guess == "Larger" and size_new >= size_old:
         # User guessed correctly
         countries_data.country_streak += 1
         if countries_data.country_streak > countries_data.country_record:
             countries_data.country_record = countries_data.country_streak
+        record_score("countries", user_id, countries_data.country_streak)
 
     elif guess == "Smaller" and size_new <= size_old:
         # User guessed correctly
         countries_data.country_streak += 1
         if countries_data.country_streak > countries_data.country_record:
             countries_data.country_record = countries_data.country_streak
+        record_score("countries", user_id, countries_data.country_streak)
 
     else:
         # User guessed incorrectly
@@ -75,34 +112,118 @@ def evaluate_countries_game(guess, user_id):
 
 
 # ####### Wordle ####### #
+class WordIndex:
+    """
+    Class containing the wordle dictionary.
+    Words are packed into a single bytes buffer of fixed-width entries,
+    with a frozenset for hashed lookups and a prefix trie for autocomplete.
+    """
+    def __init__(self, words, word_length=5):
+        self.word_length = word_length
+        words = sorted({word.lower() for word in words if len(word) == word_length})
+        self.buffer = "".join(words).encode("ascii")
+        self.words = frozenset(words)
+        self.trie = None
+
+    def __repr__(self):
+        return f"WordIndex(words={len(self)}, word_length={self.word_length})"
+
+    def __len__(self):
+        return len(self.buffer) // self.word_length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("WordIndex index out of range")
+        start = index * self.word_length
+        return self.buffer[start:start + self.word_length].decode("ascii")
+
+    def __contains__(self, word):
+        return word.lower() in self.words
+
+    def random_word(self):
+        """
+        Returns a random word(str) from the dictionary.
+        """
+        return self[random.randrange(len(self))]
+
+    def build_trie(self):
+        """
+        Builds the prefix trie, a nested dict per letter with "$" marking a full word.
+        Only done once, on the first autocomplete request.
+        """
+        trie = {}
+        for word in self:
+            node = trie
+            for letter in word:
+                node = node.setdefault(letter, {})
+            node["$"] = word
+        self.trie = trie
+
+    def complete(self, prefix, limit=10):
+        """
+        Takes a prefix(str) and a limit(int).
+        Returns a list of at most limit words(str) starting with the prefix, in alphabetical order.
+        """
+        if self.trie is None:
+            self.build_trie()
+
+        node = self.trie
+        for letter in prefix.lower():
+            node = node.get(letter)
+            if node is None:
+                return []
+
+        matches = []
+        stack = [node]
+        while stack and len(matches) < limit:
+            node = stack.pop()
+            if "$" in node:
+                matches.append(node["$"])
+            stack.extend(node[letter] for letter in sorted(node, reverse=True) if letter != "$")
+        return matches
+
+
+wordle_words = WordIndex(pd.read_csv(wordle_words_path).Word)
+# Loaded from the cache if saved by the build-wordle-patterns command, else scored directly
+wordle_patterns = PatternMatrix(wordle_words, cache_dir=WORDLE_CACHE_DIR)
+wordle_hints = CandidateIndex(wordle_words, patterns=wordle_patterns)
+
+
+@app.cli.command("build-wordle-patterns")
+def build_wordle_patterns_command():
+    """
+    Precomputes the pattern of every wordle guess against every answer.
+    """
+    wordle_patterns.save()
+    print(f"Saved {len(wordle_patterns.words)} x {len(wordle_patterns.words)} patterns"
+          f" to {wordle_patterns.path}.")
+
+
 class Wordle:
     """
     Class containing wordle game info.
+    A game's board is stored as its guesses packed into one string and a color mask,
+    one digit per letter, indexing Wordle.colors.
     """
-    df_words = pd.read_csv(wordle_words_path)
-    word_list = df_words.Word.tolist()
+    word_list = wordle_words
+    patterns = wordle_patterns
 
     def __init__(self, answer):
         self.answer = answer.upper()
-        self.guess1 = ""
-        self.guess2 = ""
-        self.guess3 = ""
-        self.guess4 = ""
-        self.guess5 = ""
-        self.round = 0
 
         self.grey = "var(--grey)"
         self.yellow = "var(--yellow)"
         self.green = "var(--green)"
+        self.colors = [self.grey, self.yellow, self.green]  # mask digits 0, 1 and 2
 
-        self.all_info = []
         self.empty = [".", self.grey]
 
         self.game_start = [self.empty for x in range(25)]
 
     def __repr__(self):
-        return f"Wordle(" \
-               f"round={self.round}, answer={self.answer})"
+        return f"Wordle(answer={self.answer})"
 
     def start_wordle(self):
         """
@@ -110,90 +231,20 @@ class Wordle:
         """
         return self.game_start
 
-    def round1_data(self, guess1, answer):
-        """
-        Takes a guess(str) and an answer(str).
-        Returns the correct divs to render the wordle page.
-        """
-        colors = []
-        for index, letter in enumerate(guess1):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess1 = guess1
-        return colors
-
-    def round2_data(self, guess2, answer):
-        """
-        Takes a guess(str) and an answer(str).
-        Returns the correct divs to render the wordle page.
-        """
-        colors = []
-        for index, letter in enumerate(guess2):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess2 = guess2
-        return colors
-
-    def round3_data(self, guess3, answer):
+    def score_guess(self, guess):
         """
-        Takes a guess(str) and an answer(str).
-        Returns the correct divs to render the wordle page.
+        Takes a guess(str).
+        Returns its color mask(str), one digit per letter.
         """
-        colors = []
-        for index, letter in enumerate(guess3):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess3 = guess3
-        return colors
-
-    def round4_data(self, guess4, answer):
-        """
-        Takes a guess(str) and an answer(str).
-        Returns the correct divs to render the wordle page.
-        """
-        colors = []
-        for index, letter in enumerate(guess4):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess4 = guess4
-        return colors
-
-    def round5_data(self, guess5, answer):
+        return pattern_to_mask(self.patterns.pattern(guess, self.answer))
+
+    def decode_board(self, guesses, color_mask):
         """
-        Takes a guess(str) and an answer(str).
-        Returns the correct divs to render the wordle page.
+        Takes the packed guesses(str) and their color mask(str).
+        Returns the divs(list) to render the wordle page.
         """
-        colors = []
-        for index, letter in enumerate(guess5):
-            if letter == answer[index]:
-                colors.append([letter, self.green])
-            elif letter in answer:
-                colors.append([letter, self.yellow])
-            else:
-                colors.append([letter, self.grey])
-        self.round += 1
-        self.guess5 = guess5
-        return colors
+        board = [[letter, self.colors[int(color)]] for letter, color in zip(guesses, color_mask)]
+        return board + self.game_start[len(board):]
 
 
 # ####### Numbers ####### #
@@ -210,3 +261,40 @@ def create_numbers_divs():
         div[1] = "boxEmpty"
     random.shuffle(numbers_divs)
     return numbers_divs
+
+
+def start_numbers_game(user_id):
+    """
+    Takes a user_id(int) and starts a new numbers game, restarting the users unfinished game
+    if there is one, in a single upsert on the unique index of unfinished games.
+    """
+    statement = sqlite_insert(NumbersData).values(user_id=user_id,
+                                                  numbers_start=time.time(),
+                                                  numbers_stop=-1,
+                                                  numbers_time=-1)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=["user_id"],
+        index_where=NumbersData.numbers_time == -1,
+        set_={"numbers_start": statement.excluded.numbers_start},
+    ))
+    db.session.commit()
+
+
+def stop_numbers_game(user_id):
+    """
+    Takes a user_id(int) and stops the users unfinished numbers game,
+    saving its time and leaderboard scores in one transaction.
+    Returns the finished numbers_data(class), else returns None if no game was going on.
+    """
+    numbers_data = NumbersData.query.filter_by(user_id=user_id, numbers_time=-1).first()
+    if numbers_data is None:
+        return None
+
+    numbers_data.numbers_stop = time.time()
+    numbers_data.numbers_time = round((numbers_data.numbers_stop - numbers_data.numbers_start), 4)
+    record_score("numbers", user_id, numbers_data.numbers_time, numbers_data.numbers_stop)
+    # Read before the commit expires the row, so recording it costs no extra select
+    score = Score(numbers_data.numbers_time, numbers_data.id, numbers_data.user_id)
+    db.session.commit()
+    numbers_leaderboard.record(score)
+    return numbers_data
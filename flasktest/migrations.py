@@ -0,0 +1,230 @@
+"""
+Schema migrations for the SQLite database.
+db.create_all() only creates missing tables, so changes to existing tables, such as new columns,
+new indexes or rows that have to be cleaned up first, are numbered migrations here. They run in
+order on start-up, each once per database, recorded in the schema_migration table.
+Every worker runs them on start-up, so they run in one transaction that holds the write lock,
+workers starting at the same time wait for it and then find the migrations applied.
+New migrations go at the end of the list; applied ones are never edited or reordered.
+Also has the query plan check for the hot queries, flask check-query-plans.
+"""
+
+import time
+
+from sqlalchemy import insert, inspect, select, text
+
+from flasktest import app, db
+from flasktest.models import User, CountriesData, WordleData, NumbersData, MailOutbox, \
+    PubgJob, PubgSeasonStats, SchemaMigration, select_request_user, select_latest_wordle
+from flasktest.games.utils import Wordle
+from flasktest.games.leaderboard import select_best_times
+from flasktest.apis.stats_store import select_player_stats
+
+MIGRATION_LOCK_TIMEOUT = 600  # seconds a worker waits for another one's migrations
+
+
+def create_indexes(connection, *names):
+    """
+    Takes a connection and the names(str) of indexes declared on the models,
+    creates the missing ones.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(connection, checkfirst=True)
+
+
+def migrate_numbers_data(connection):
+    """
+    Takes a connection.
+    Removes all but the latest unfinished numbers game of each user, so the unique index
+    on unfinished games can be created on databases that predate it.
+    Returns the number(int) of games removed.
+    """
+    table = NumbersData.__tablename__
+    result = connection.execute(text(
+        f"DELETE FROM {table} WHERE numbers_time = -1 AND id NOT IN"
+        f" (SELECT MAX(id) FROM {table} WHERE numbers_time = -1 GROUP BY user_id)"))
+    return result.rowcount
+
+
+def migrate_wordle_data(connection):
+    """
+    Takes a connection.
+    Adds the packed wordle_guesses and wordle_colors columns to databases that predate them,
+    and packs games saved in the old wordle_guess1..5 columns into them.
+    Returns the number(int) of games packed.
+    """
+    table = WordleData.__tablename__
+    columns = {column["name"] for column in inspect(connection).get_columns(table)}
+
+    for column in ("wordle_guesses", "wordle_colors"):
+        if column not in columns:
+            connection.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN {column} VARCHAR(25) NOT NULL DEFAULT ''"))
+
+    if "wordle_guess1" not in columns:
+        return 0
+
+    rows = connection.execute(text(
+        f"SELECT id, wordle_answer, wordle_guess1, wordle_guess2, wordle_guess3,"
+        f" wordle_guess4, wordle_guess5 FROM {table}"
+        f" WHERE wordle_guesses = '' AND wordle_guess1 IS NOT NULL")).all()
+
+    packed = []
+    for row in rows:
+        wordle_game = Wordle(row.wordle_answer)
+        guesses = [guess for guess in row[2:] if guess]
+        packed.append({
+            "id": row.id,
+            "guesses": "".join(guesses),
+            "colors": "".join(wordle_game.score_guess(guess) for guess in guesses),
+        })
+
+    if packed:
+        connection.execute(text(f"UPDATE {table} SET wordle_guesses = :guesses,"
+                                f" wordle_colors = :colors WHERE id = :id"), packed)
+    return len(packed)
+
+
+def migrate_pubg_stats_finalized(connection):
+    """
+    Takes a connection.
+    Adds the finalized column to pubg stats stores that predate it. Every season but the newest
+    stored one is marked finalized, as the stats were saved before it could be tracked.
+    Returns the number(int) of seasons marked finalized.
+    """
+    table = PubgSeasonStats.__tablename__
+    columns = {column["name"] for column in inspect(connection).get_columns(table)}
+    if "finalized" in columns:
+        return 0
+
+    connection.execute(text(
+        f"ALTER TABLE {table} ADD COLUMN finalized BOOLEAN NOT NULL DEFAULT 0"))
+    result = connection.execute(text(f"UPDATE {table} SET finalized = 1 WHERE position > 0"))
+    return result.rowcount
+
+
+def migrate_pubg_jobs(connection):
+    """
+    Takes a connection.
+    Fails all but the oldest queued or running job of each lookup, so the unique index
+    on active jobs can be created on databases that predate it.
+    Returns the number(int) of jobs failed.
+    """
+    table = PubgJob.__tablename__
+    active = "status IN ('queued', 'running')"
+    result = connection.execute(text(
+        f"UPDATE {table} SET status = 'failed', progress = NULL,"
+        f" message = 'Replaced by an identical lookup.' WHERE {active} AND id NOT IN"
+        f" (SELECT MIN(id) FROM {table} WHERE {active} GROUP BY name, game_mode)"))
+    create_indexes(connection, "ix_pubg_job_active")
+    return result.rowcount
+
+
+# (version, name, function taking the connection), applied in this order
+migrations = [
+    (1, "remove_duplicate_unfinished_numbers", migrate_numbers_data),
+    (2, "numbers_indexes", lambda connection: create_indexes(
+        connection, "ix_numbers_data_user_id_numbers_time", "ix_numbers_data_numbers_time",
+        "ix_numbers_data_unfinished")),
+    (3, "pack_wordle_guesses", migrate_wordle_data),
+    (4, "user_id_indexes", lambda connection: create_indexes(
+        connection, "ix_countries_data_user_id", "ix_wordle_data_user_id_id")),
+    (5, "pubg_stats_finalized", migrate_pubg_stats_finalized),
+    (6, "pubg_job_active_index", migrate_pubg_jobs),
+]
+
+
+def run_migrations():
+    """
+    Creates missing tables, then applies the migrations this database has not had yet,
+    all in one transaction that holds the write lock.
+    Returns the names(list) of the migrations applied.
+    """
+    names = []
+    with db.engine.connect() as connection:
+        previous_timeout = connection.exec_driver_sql("PRAGMA busy_timeout").scalar()
+        # Workers starting together wait for the one migrating, large tables take a while
+        connection.exec_driver_sql(f"PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT * 1000}")
+        try:
+            with connection.begin():
+                # sqlite3 only begins before a write, the tables and applied migrations have
+                # to be read under the write lock, or another worker may migrate in between
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+                # Only creates missing tables with their indexes, new models need no migration
+                db.metadata.create_all(connection)
+                applied = set(connection.execute(select(SchemaMigration.version)).scalars())
+
+                for version, name, migrate in migrations:
+                    if version in applied:
+                        continue
+                    migrate(connection)
+                    connection.execute(insert(SchemaMigration)
+                                       .values(version=version, name=name, applied=time.time()))
+                    app.logger.info(f"applied migration {version} {name}")
+                    names.append(name)
+        finally:
+            # The connection goes back to the pool for requests
+            connection.exec_driver_sql(f"PRAGMA busy_timeout = {previous_timeout}")
+    return names
+
+
+# -query plans------------------------------------------------------ #
+def get_hot_queries():
+    """
+    Returns a dict of name(str): statement for the queries run on nearly every request.
+    """
+    return {
+        "user by email": select(User).where(User.email == "player@example.com"),
+        "user with countries": select_request_user(1, ("countries",)),
+        "user with last wordle": select_request_user(1, ("wordle",)),
+        "countries by user": select(CountriesData).where(CountriesData.user_id == 1),
+        "last wordle by user": select(WordleData).where(WordleData.id == select_latest_wordle(1)),
+        "unfinished numbers game": select(NumbersData)
+        .where(NumbersData.user_id == 1, NumbersData.numbers_time == -1),
+        "best times": select_best_times(),
+        "personal best times": select_best_times(1),
+        "api quota": text("SELECT tokens, updated FROM api_quota WHERE api_name = 'pubg'"),
+        "player stats": select_player_stats("player", "solo-fpp"),
+        "due emails": select(MailOutbox.id)
+        .where(MailOutbox.status.in_(("queued", "sending")), MailOutbox.next_attempt <= 0)
+        .order_by(MailOutbox.next_attempt).limit(20),
+    }
+
+
+def check_query_plans():
+    """
+    Runs EXPLAIN QUERY PLAN for every hot query.
+    Returns a dict of name(str): list of plan steps(str), and the names(list) of the queries
+    that scan a whole table.
+    """
+    plans = {}
+    full_scans = []
+    # sqlite3 caches prepared statements per connection and a cached EXPLAIN keeps the plan it
+    # was prepared with, so the plans are read on a connection that is thrown away afterwards
+    with db.engine.connect() as connection:
+        for name, statement in get_hot_queries().items():
+            sql = str(statement.compile(dialect=db.engine.dialect,
+                                        compile_kwargs={"literal_binds": True}))
+            steps = [row[3] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            plans[name] = steps
+            # SEARCH or SCAN USING an index is fine, without one the whole table is read, and a
+            # bare SEARCH is max(id) walking the rows backwards until one matches
+            if any(step.startswith(("SCAN ", "SEARCH ")) and " USING " not in step
+                   for step in steps):
+                full_scans.append(name)
+        connection.invalidate()
+    return plans, full_scans
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """
+    Prints the query plan of every hot query and fails when one scans a whole table.
+    """
+    plans, full_scans = check_query_plans()
+    for name, steps in plans.items():
+        print(f"{'FULL SCAN' if name in full_scans else 'ok':<9} {name}: {'; '.join(steps)}")
+    if full_scans:
+        raise SystemExit(f"{len(full_scans)} hot queries scan a whole table")
@@ -4,13 +4,18 @@ Contains all models and their methods for the flask app.
 
 import random
 
-from flasktest import db, bcrypt, login_manager
+from flasktest import db, login_manager
+from flasktest.users.hashing import password_hasher
+from flask import g, has_request_context, request
 from flask_login import UserMixin
+from sqlalchemy import select, insert, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(str(user_id))
+    return load_request_user(int(user_id))
 
 
 # ----------------------- Models ----------------------- #
@@ -36,6 +41,9 @@ class CountriesData(db.Model):
     """
     Stores Users info on Countries game.
     """
+    __table_args__ = (
+        db.Index("ix_countries_data_user_id", "user_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))  # relationship
     country_old = db.Column(db.Integer, unique=False, nullable=True)
@@ -53,15 +61,17 @@ class WordleData(db.Model):
     """
     Stores Users info on Wordle game.
     """
+    __table_args__ = (
+        # Finds a users last game without scanning everyone elses
+        db.Index("ix_wordle_data_user_id_id", "user_id", "id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))  # relationship
     wordle_answer = db.Column(db.String(100), unique=False, nullable=True)
     wordle_round = db.Column(db.Integer, unique=False, nullable=True)
-    wordle_guess1 = db.Column(db.String(100), unique=False, nullable=True)
-    wordle_guess2 = db.Column(db.String(100), unique=False, nullable=True)
-    wordle_guess3 = db.Column(db.String(100), unique=False, nullable=True)
-    wordle_guess4 = db.Column(db.String(100), unique=False, nullable=True)
-    wordle_guess5 = db.Column(db.String(100), unique=False, nullable=True)
+    # All guesses packed together, and one color digit per letter so boards are never re-scored
+    wordle_guesses = db.Column(db.String(25), unique=False, nullable=False, default="")
+    wordle_colors = db.Column(db.String(25), unique=False, nullable=False, default="")
     wordle_win_round = db.Column(db.Integer, unique=False, nullable=True)
     wordle_game_state = db.Column(db.String(10), unique=False, nullable=True)
 
@@ -74,6 +84,13 @@ class NumbersData(db.Model):
     """
     Stores Users info on Numbers game.
     """
+    __table_args__ = (
+        db.Index("ix_numbers_data_user_id_numbers_time", "user_id", "numbers_time"),
+        db.Index("ix_numbers_data_numbers_time", "numbers_time"),
+        # A user has at most one unfinished game, so starting one can be a single upsert
+        db.Index("ix_numbers_data_unfinished", "user_id", unique=True,
+                 sqlite_where=db.text("numbers_time = -1")),
+    )
     id = db.Column(db.Integer(), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))  # relationship
     numbers_start = db.Column(db.Float(), nullable=False)
@@ -85,73 +102,311 @@ class NumbersData(db.Model):
                f" numbers_time={self.numbers_time})"
 
 
-class APIData(db.Model):
+class LeaderboardScore(db.Model):
     """
-    Stores pubg api availability.
+    Stores a Users best score per game and time bucket, updated whenever they play.
     """
+    __table_args__ = (
+        db.Index("ix_leaderboard_score_user", "game", "period", "bucket", "user_id",
+                 unique=True),
+        db.Index("ix_leaderboard_score_rank", "game", "period", "bucket", "score", "user_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    api_name = db.Column(db.String(30), unique=True, nullable=False)
-    last_used = db.Column(db.Integer, unique=False, nullable=True)
-    timer = db.Column(db.Integer, unique=False, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))  # relationship
+    game = db.Column(db.String(20), unique=False, nullable=False)
+    period = db.Column(db.String(10), unique=False, nullable=False)  # day, week or all
+    bucket = db.Column(db.String(10), unique=False, nullable=False)  # 2023-03-14, 2023-W11, all
+    score = db.Column(db.Float, unique=False, nullable=False)
+    achieved = db.Column(db.Float, unique=False, nullable=False)
 
+    def __repr__(self):
+        return f"LeaderboardScore(game={self.game}, bucket={self.bucket}," \
+               f" user_id={self.user_id}, score={self.score})"
 
-# -User------------------ Model functions ----------------------- #
-from flasktest.games.utils import Wordle
 
+class APIQuota(db.Model):
+    """
+    Stores the token bucket shared by every worker for an api's request quota.
+    """
+    api_name = db.Column(db.String(30), primary_key=True)
+    tokens = db.Column(db.Float, unique=False, nullable=False)
+    updated = db.Column(db.Float, unique=False, nullable=False)
 
-def add_test_user(email, username, hashed_password, reset_key=000000):
+    def __repr__(self):
+        return f"APIQuota(api_name={self.api_name}, tokens={self.tokens})"
+
+
+class PubgJob(db.Model):
     """
-    Takes register_form input and creates a new TEST user with default settings.
+    Stores queued and finished pubg stat lookups.
     """
-    # noinspection PyArgumentList
-    new_user = User(
-        email=email,
-        username=username,
-        password=hashed_password,
-        reset_key=reset_key,
+    __table_args__ = (
+        # One queued or running job per lookup, shared by the requests of every worker
+        db.Index("ix_pubg_job_active", "name", "game_mode", unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running')")),
     )
-    db.session.add(new_user)
-    db.session.commit()
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=False, nullable=False)
+    game_mode = db.Column(db.String(20), unique=False, nullable=False)
+    status = db.Column(db.String(10), unique=False, nullable=False, default="queued")
+    progress = db.Column(db.String(50), unique=False, nullable=True)
+    message = db.Column(db.String(100), unique=False, nullable=True)
+    kills_img = db.Column(db.String(200), unique=False, nullable=True)
+    damage_img = db.Column(db.String(200), unique=False, nullable=True)
+    distance_img = db.Column(db.String(200), unique=False, nullable=True)
+    created = db.Column(db.Integer, unique=False, nullable=False)
+    updated = db.Column(db.Integer, unique=False, nullable=False)
 
-    countries_data = CountriesData(
-        country_old=random.randint(1, 40),
-        country_new=random.randint(1, 40),
-        country_streak=0,
-        country_record=0,
-        user_id=new_user.id,
+    def __repr__(self):
+        return f"PubgJob(id={self.id}, name={self.name}, game_mode={self.game_mode}," \
+               f" status={self.status})"
+
+
+class PubgSeasonStats(db.Model):
+    """
+    Stores a player's raw pubg stats per game mode and season.
+    """
+    __table_args__ = (
+        db.Index("ix_pubg_season_stats_player_mode_season", "player", "game_mode", "season",
+                 unique=True),
     )
-    db.session.add(countries_data)
-    db.session.commit()
+    id = db.Column(db.Integer, primary_key=True)
+    player = db.Column(db.String(50), unique=False, nullable=False)
+    game_mode = db.Column(db.String(20), unique=False, nullable=False)
+    season = db.Column(db.String(20), unique=False, nullable=False)
+    position = db.Column(db.Integer, unique=False, nullable=False)  # 0 is the newest season
+    games = db.Column(db.Integer, unique=False, nullable=False)
+    wins = db.Column(db.Integer, unique=False, nullable=False)
+    top10s = db.Column(db.Integer, unique=False, nullable=False)
+    damage = db.Column(db.Float, unique=False, nullable=False)
+    kills = db.Column(db.Integer, unique=False, nullable=False)
+    headshots = db.Column(db.Integer, unique=False, nullable=False)
+    assists = db.Column(db.Integer, unique=False, nullable=False)
+    most_kills = db.Column(db.Integer, unique=False, nullable=False)
+    distance = db.Column(db.Float, unique=False, nullable=False)
+    finalized = db.Column(db.Boolean, unique=False, nullable=False, default=False)  # season ended
+    fetched = db.Column(db.Integer, unique=False, nullable=False)
+
+    def __repr__(self):
+        return f"PubgSeasonStats(player={self.player}, game_mode={self.game_mode}," \
+               f" season={self.season})"
+
+
+class PubgLookupCache(db.Model):
+    """
+    Stores cached pubg api lookups, such as the seasons list and player ids.
+    """
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Text, unique=False, nullable=False)  # json
+    expires = db.Column(db.Integer, unique=False, nullable=False)
+
+    def __repr__(self):
+        return f"PubgLookupCache(key={self.key}, expires={self.expires})"
+
+
+class MailOutbox(db.Model):
+    """
+    Stores outgoing emails until the mail sender has delivered them.
+    """
+    __table_args__ = (
+        db.Index("ix_mail_outbox_status_next_attempt", "status", "next_attempt"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    to_addr = db.Column(db.String(75), unique=False, nullable=False)
+    subject = db.Column(db.String(100), unique=False, nullable=False)
+    body = db.Column(db.Text, unique=False, nullable=False)
+    status = db.Column(db.String(10), unique=False, nullable=False, default="queued")
+    attempts = db.Column(db.Integer, unique=False, nullable=False, default=0)
+    # When the next attempt is due, or while sending until when the sender holds the message
+    next_attempt = db.Column(db.Float, unique=False, nullable=False)
+    created = db.Column(db.Float, unique=False, nullable=False)
+    sent = db.Column(db.Float, unique=False, nullable=True)
+    error = db.Column(db.String(200), unique=False, nullable=True)
+
+    def __repr__(self):
+        return f"MailOutbox(id={self.id}, to_addr={self.to_addr}, status={self.status}," \
+               f" attempts={self.attempts})"
+
+
+class SchemaMigration(db.Model):
+    """
+    Stores which schema migrations have been applied to the database, see migrations.py.
+    """
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=False, nullable=False)
+    applied = db.Column(db.Float, unique=False, nullable=False)
+
+    def __repr__(self):
+        return f"SchemaMigration(version={self.version}, name={self.name})"
+
 
+# -Request--------------- Model functions ----------------------- #
+# endpoint: game rows the route reads, fetched together with the logged in user
+endpoint_games = {
+    "games.countries": ("countries",),
+    "games.play_wordle": ("wordle",),
+    "games.wordle_hint": ("wordle",),
+}
 
-def add_new_user(email, username, hashed_password, reset_key=000000):
+
+def get_identity_map():
+    """
+    Returns the rows(dict) already loaded in the current request,
+    keyed by (game, user_id). Outside of a request nothing is kept, so returns None.
+    """
+    if not has_request_context():
+        return None
+    if "identity_map" not in g:
+        g.identity_map = {}
+    return g.identity_map
+
+
+def select_latest_wordle(user_id):
+    """
+    Takes a user_id(int), or a column to correlate with.
+    Returns the scalar subquery for the id of the users last wordle game.
+    """
+    # Aliased so it can sit in a query that selects WordleData itself
+    latest = aliased(WordleData)
+    return select(func.max(latest.id)).where(latest.user_id == user_id).scalar_subquery()
+
+
+def select_request_user(user_id, games=()):
+    """
+    Takes a user_id(int) and the games(tuple) whose rows to join, countries and or wordle.
+    Returns the select statement for the user followed by those game rows.
+    """
+    statement = select(User).where(User.id == user_id)
+    if "countries" in games:
+        statement = statement.add_columns(CountriesData)\
+            .outerjoin(CountriesData, CountriesData.user_id == User.id)
+    if "wordle" in games:
+        statement = statement.add_columns(WordleData)\
+            .outerjoin(WordleData, WordleData.id == select_latest_wordle(User.id))
+    return statement
+
+
+def load_request_user(user_id):
+    """
+    Takes a user_id(int) and loads the user with the game rows the requested route reads,
+    in one joined query, keeping the game rows for the rest of the request.
+    Returns the user(class), else None.
+    """
+    games = endpoint_games.get(request.endpoint, ()) if has_request_context() else ()
+    row = db.session.execute(select_request_user(user_id, games)).first()
+    if row is None:
+        return None
+
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        for game, data in zip(games, row[1:]):
+            identity_map[(game, user_id)] = data
+    return row[0]
+
+
+def get_request_row(game, user_id, load):
+    """
+    Takes a game(str), user_id(int) and a load function querying the row.
+    Returns the row loaded earlier in this request, else loads and keeps it.
+    """
+    identity_map = get_identity_map()
+    if identity_map is None:
+        return load()
+    if (game, user_id) not in identity_map:
+        identity_map[(game, user_id)] = load()
+    return identity_map[(game, user_id)]
+
+
+def get_countries_data(user_id):
+    """
+    Takes a user_id(int).
+    Returns the users countries_data(class), else None.
+    """
+    return get_request_row("countries", user_id,
+                           lambda: CountriesData.query.filter_by(user_id=user_id).first())
+
+
+def get_wordle_data(user_id):
     """
-    Takes register_form input and creates a new user with default settings.
+    Takes a user_id(int).
+    Returns the users last wordle_data(class), else None.
+    """
+    return get_request_row("wordle", user_id,
+                           lambda: WordleData.query.filter(
+                               WordleData.id == select_latest_wordle(user_id)).first())
+
+
+# -User------------------ Model functions ----------------------- #
+from flasktest.games.utils import Wordle
+
+
+def provision_user(email, username, hashed_password, reset_key=000000):
+    """
+    Takes register_form input and creates a new user with default settings and the
+    state of every game in one transaction, leaving duplicate emails to the unique index.
+    Returns the new user(class), else None if the email is already registered.
     """
     # noinspection PyArgumentList
     new_user = User(
-        email=email.data,
-        username=username.data,
+        email=email,
+        username=username,
         password=hashed_password,
         reset_key=reset_key,
     )
+    new_user.countries_games.append(add_new_countries(user_id=None))
     db.session.add(new_user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return new_user
 
-    countries_data = add_new_countries(user_id=new_user.id)
-    db.session.add(countries_data)
-    db.session.commit()
+
+def provision_users(rows):
+    """
+    Takes rows(list) of dicts with an email, username and hashed_password, such as accounts
+    for a load test, and creates them with their game state in one transaction.
+    Returns the number(int) of users created.
+    Raises IntegrityError when an email is already registered, then nothing is saved.
+    """
+    users = [{"email": row["email"], "username": row["username"],
+              "password": row["hashed_password"], "reset_key": row.get("reset_key", 000000)}
+             for row in rows]
+    if not users:
+        return 0
+
+    try:
+        db.session.execute(insert(User), users)
+        # The insert holds the write lock, so the new ids are the highest and consecutive
+        first_id = db.session.execute(select(func.max(User.id))).scalar() - len(users) + 1
+        db.session.execute(insert(CountriesData), [
+            {"user_id": user_id, "country_old": random.randint(1, 30),
+             "country_new": random.randint(1, 30), "country_streak": 0, "country_record": 0}
+            for user_id in range(first_id, first_id + len(users))
+        ])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise
+    return len(users)
 
 
 def do_passwords_match(user, password):
     """
     Takes a user(class) and a password(str) to match in the database.
+    A match made with an outdated work factor is hashed again and saved.
     Returns True(bool) match.
     Else returns False(bool)
+    Raises HashingBusy when too many passwords are being checked at once.
     """
-    if bcrypt.check_password_hash(user.password, password.data):
-        return True
-    return False
+    if not password_hasher.check(user.password, password.data):
+        return False
+
+    if password_hasher.needs_rehash(user.password):
+        user.password = password_hasher.hash(password.data)
+        db.session.commit()
+    return True
 
 
 def change_password(user_id, hashed_password):
@@ -201,32 +456,25 @@ def start_new_wordle(user_id):
     Takes a user_id(int), creates a new Wordle game and saves it in the Users data.
     Returns a new_wordle(class) for the Wordle game.
     """
-    wordle_answer = Wordle(random.choice(Wordle.word_list)).answer
-    wordle_divs = Wordle(random.choice(Wordle.word_list)).game_start
+    wordle_game = Wordle(Wordle.word_list.random_word())
+    wordle_answer = wordle_game.answer
+    wordle_divs = wordle_game.game_start
     wordle_data = add_new_wordle(user_id=user_id, answer=wordle_answer)
     db.session.add(wordle_data)
     db.session.commit()
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        identity_map[("wordle", user_id)] = wordle_data
     return wordle_divs
 
 
-def get_last_wordle_guess(wordle_data):
+def get_wordle_board(wordle_data):
     """
-    Takes a Users wordle_data(class) and returns the Users last made guess.
+    Takes a Users wordle_data(class).
+    Returns the wordle_divs(list) of the game so far to be rendered.
     """
-    if wordle_data.wordle_guess4 is not None:
-        return wordle_data.wordle_guess4
-
-    if wordle_data.wordle_guess3 is not None:
-        return wordle_data.wordle_guess3
-
-    if wordle_data.wordle_guess2 is not None:
-        return wordle_data.wordle_guess2
-
-    if wordle_data.wordle_guess1 is not None:
-        return wordle_data.wordle_guess1
-
-    if wordle_data.wordle_guess1 is not None:
-        return wordle_data.wordle_guess1
+    wordle_game = Wordle(wordle_data.wordle_answer)
+    return wordle_game.decode_board(wordle_data.wordle_guesses, wordle_data.wordle_colors)
 
 
 def play_wordle_game(wordle_guess, user_id):
@@ -235,83 +483,29 @@ def play_wordle_game(wordle_guess, user_id):
     Takes a Users wordle_guess(str) and user_id(int).
     Returns the game state(str) and the wordle_divs(list) to be rendered.
     """
-    descending = WordleData.query.order_by(WordleData.id.desc())
-    wordle_data = descending.filter_by(user_id=user_id).first()
+    wordle_data = get_wordle_data(user_id)
     wordle_game = Wordle(wordle_data.wordle_answer)
-    wordle_divs = wordle_game.game_start
+
+    # Only the new guess is scored, earlier rows come from the stored color mask
+    wordle_guess = wordle_guess.upper()
+    wordle_data.wordle_guesses += wordle_guess
+    wordle_data.wordle_colors += wordle_game.score_guess(wordle_guess)
+    wordle_data.wordle_round += 1
 
     # There is an active game
     game_state = "busy"
     # Check for win
-    if wordle_data.wordle_answer == wordle_guess.upper():
-        wordle_data.wordle_game_state = "win"
+    if wordle_data.wordle_answer == wordle_guess:
         game_state = "win"
+        wordle_data.wordle_game_state = "win"
+        wordle_data.wordle_win_round = wordle_data.wordle_round
 
-    if wordle_data.wordle_round == 4:
-        wordle_game = Wordle(wordle_data.wordle_answer)
-        wordle_divs[:5] = wordle_game.round1_data(wordle_data.wordle_guess1,
-                                                  wordle_data.wordle_answer)
-        wordle_divs[5:10] = wordle_game.round2_data(wordle_data.wordle_guess2,
-                                                    wordle_data.wordle_answer)
-        wordle_divs[10:15] = wordle_game.round3_data(wordle_data.wordle_guess3,
-                                                     wordle_data.wordle_answer)
-        wordle_divs[15:20] = wordle_game.round4_data(wordle_data.wordle_guess4,
-                                                     wordle_data.wordle_answer)
-        wordle_divs[20:25] = wordle_game.round5_data(wordle_guess.upper(),
-                                                     wordle_data.wordle_answer)
-        wordle_data.wordle_round = 5
-        wordle_data.wordle_guess5 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 5
-        else:
-            game_state = "loss"
-            wordle_data.wordle_game_state = "loss"
-            wordle_data.wordle_win_round = -1
-
-    elif wordle_data.wordle_round == 3:
-        wordle_divs[:5] = wordle_game.round1_data(wordle_data.wordle_guess1,
-                                                  wordle_data.wordle_answer)
-        wordle_divs[5:10] = wordle_game.round2_data(wordle_data.wordle_guess2,
-                                                    wordle_data.wordle_answer)
-        wordle_divs[10:15] = wordle_game.round3_data(wordle_data.wordle_guess3,
-                                                     wordle_data.wordle_answer)
-        wordle_divs[15:20] = wordle_game.round4_data(wordle_guess.upper(),
-                                                     wordle_data.wordle_answer)
-        wordle_data.wordle_round = 4
-        wordle_data.wordle_guess4 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 4
-
-    elif wordle_data.wordle_round == 2:
-        wordle_divs[:5] = wordle_game.round1_data(wordle_data.wordle_guess1,
-                                                  wordle_data.wordle_answer)
-        wordle_divs[5:10] = wordle_game.round2_data(wordle_data.wordle_guess2,
-                                                    wordle_data.wordle_answer)
-        wordle_divs[10:15] = wordle_game.round3_data(wordle_guess.upper(),
-                                                     wordle_data.wordle_answer)
-        wordle_data.wordle_round = 3
-        wordle_data.wordle_guess3 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 3
-
-    elif wordle_data.wordle_round == 1:
-        wordle_divs[:5] = wordle_game.round1_data(wordle_data.wordle_guess1,
-                                                  wordle_data.wordle_answer)
-        wordle_divs[5:10] = wordle_game.round2_data(wordle_guess.upper(),
-                                                    wordle_data.wordle_answer)
-        wordle_data.wordle_round = 2
-        wordle_data.wordle_guess2 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 2
-
-    if wordle_data.wordle_round == 0:
-        # Response after 1st guess
-        wordle_divs[:5] = wordle_game.round1_data(wordle_guess.upper(),
-                                                  wordle_data.wordle_answer)
-        wordle_data.wordle_round = 1
-        wordle_data.wordle_guess1 = wordle_guess.upper()
-        if game_state == "win":
-            wordle_data.wordle_win_round = 1
+    elif wordle_data.wordle_round == 5:
+        game_state = "loss"
+        wordle_data.wordle_game_state = "loss"
+        wordle_data.wordle_win_round = -1
 
+    # Decoded before the commit expires the row, so rendering it costs no extra select
+    wordle_divs = wordle_game.decode_board(wordle_data.wordle_guesses, wordle_data.wordle_colors)
     db.session.commit()
     return game_state, wordle_divs
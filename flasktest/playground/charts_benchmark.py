@@ -0,0 +1,81 @@
+"""
+Compares per-chart latency and memory of the pubg chart backends.
+Each backend runs in its own process so their memory use does not mix.
+RSS is summed over the process and its children (the Kaleido browser), read from /proc.
+Run from the project root: python -m flasktest.playground.charts_benchmark
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+CHARTS = 30
+df_example = pd.read_csv("flasktest/static/data/api/pubg/df_hambinooo_solo_fpp.csv")
+
+
+def get_rss_mb(pid):
+    """
+    Takes a pid(int) and returns the resident memory(float) in MB of it and its children.
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as stat_file:
+                    parent = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+
+    total_kb = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as status_file:
+                for line in status_file:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return total_kb / 1024
+
+
+def run_backend(backend, results):
+    """
+    Takes a backend name(str) and a shared results(dict).
+    Renders CHARTS charts and stores the first and average latency and peak RSS.
+    """
+    from flasktest.apis.charts import get_chart_extension, render_bar_chart
+
+    timings = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for index in range(CHARTS):
+            path = os.path.join(temp_dir, f"chart_{index}.{get_chart_extension(backend)}")
+            start = time.perf_counter()
+            render_bar_chart(df_example, x="Season", y="Kills_g",
+                             title="Kills per game vs season | hambinooo solo-fpp",
+                             xaxis_title="Season", yaxis_title="Kills per game",
+                             path=path, backend=backend)
+            timings.append(time.perf_counter() - start)
+
+    results[backend] = (timings[0], sum(timings[1:]) / (CHARTS - 1), get_rss_mb(os.getpid()))
+
+
+if __name__ == "__main__":
+    from flasktest.apis.charts import chart_backends
+
+    manager = multiprocessing.Manager()
+    results = manager.dict()
+    for backend in chart_backends:
+        process = multiprocessing.Process(target=run_backend, args=(backend, results))
+        process.start()
+        process.join()
+
+    print(f"{'backend':<10}{'first chart':>14}{'per chart':>12}{'rss':>10}")
+    for backend, (first, average, rss) in results.items():
+        print(f"{backend:<10}{first * 1000:>11.1f} ms{average * 1000:>9.1f} ms{rss:>7.0f} MB")
@@ -0,0 +1,113 @@
+"""
+Measures game route throughput with concurrent players, each in its own process like a worker,
+with SQLite's own settings and with the wal profile, see sqlite_profile.py.
+Every player views and plays countries, wordle and numbers in a loop for SECONDS.
+Creates the players in the app database, so point SQLITE_URI at an empty scratch directory.
+Run from the project root, optionally with the number of players:
+SQLITE_URI=$(mktemp -d) python -m flasktest.playground.concurrency_benchmark 8
+"""
+
+import logging
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+from flasktest import app, db
+from flasktest.models import User, provision_users
+
+PLAYERS = 8
+SECONDS = 10
+PROFILES = ("default", "wal")
+
+# (method, url, form data) requested by every player in this order
+player_steps = [
+    ("GET", "/games/countries", None),
+    ("POST", "/games/countries", {"select": "Larger"}),
+    ("GET", "/games/play-wordle", None),
+    ("POST", "/games/play-wordle", {"guess": "CRANE"}),
+    ("GET", "/games/numbers", None),
+    ("POST", "/games/numbers", {"submit": "Stop"}),
+]
+
+
+def play(user_id, barrier, results):
+    """
+    Takes a user_id(int), a barrier all players start at and a results queue.
+    Plays the games for SECONDS and puts the request latencies(list) and errors(int) on the queue.
+    """
+    app.config.update(WTF_CSRF_ENABLED=False)
+    app.logger.setLevel(logging.CRITICAL)  # "database is locked" tracebacks, counted as errors
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user_id)
+        session["_fresh"] = True
+        session["id"] = user_id  # set by the login route
+
+    latencies = []
+    errors = 0
+    barrier.wait()
+    end = time.perf_counter() + SECONDS
+    while time.perf_counter() < end:
+        for method, url, data in player_steps:
+            start = time.perf_counter()
+            response = client.open(url, method=method, data=data)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 500
+    results.put((latencies, errors))
+
+
+def set_journal_mode(mode):
+    """
+    Takes a journal mode(str) and sets it on the database, which needs the only connection.
+    """
+    db.engine.dispose()
+    connection = sqlite3.connect(db.engine.url.database)
+    connection.execute(f"PRAGMA journal_mode = {mode}")
+    connection.close()
+
+
+def run_players(profile, players):
+    """
+    Takes a profile name(str) and the number(int) of players.
+    Returns the request latencies(list) and number(int) of errors of all players.
+    """
+    # Spawned players import flasktest again, with the profile from the environment
+    os.environ["SQLITE_PROFILE"] = profile
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(players)
+    results = context.Queue()
+    processes = [context.Process(target=play, args=(user_id, barrier, results))
+                 for user_id in range(1, players + 1)]
+    for process in processes:
+        process.start()
+
+    latencies = []
+    errors = 0
+    for _ in processes:
+        player_latencies, player_errors = results.get()
+        latencies += player_latencies
+        errors += player_errors
+    for process in processes:
+        process.join()
+    return latencies, errors
+
+
+if __name__ == "__main__":
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else PLAYERS
+    with app.app_context():
+        if User.query.first() is not None:
+            raise SystemExit("There are users already, point SQLITE_URI at a scratch directory")
+        provision_users({"email": f"player{number}@example.com", "username": f"player{number}",
+                         "hashed_password": b"not used"} for number in range(players))
+
+        print(f"{players} players for {SECONDS} s, {os.cpu_count()} cpus")
+        print(f"{'profile':<8} {'requests/s':>10} {'median':>9} {'p95':>9} {'errors':>7}")
+        for profile in PROFILES:
+            set_journal_mode("WAL" if profile == "wal" else "DELETE")
+            latencies, errors = run_players(profile, players)
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            print(f"{profile:<8} {len(latencies) / SECONDS:10.0f}"
+                  f" {statistics.median(latencies) * 1000:7.1f}ms {p95 * 1000:7.1f}ms {errors:7}")
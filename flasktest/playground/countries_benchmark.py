@@ -0,0 +1,38 @@
+"""
+Compares the in-process country catalog against parsing df_europe.csv on every lookup.
+Run from the project root: python -m flasktest.playground.countries_benchmark
+"""
+
+import timeit
+
+import pandas as pd
+
+from flasktest.games.utils import df_europe_path, get_country
+
+LOOKUPS = 8  # lookups made by a single Countries POST before the catalog
+ROUNDS = 200
+
+
+def lookup_with_read_csv():
+    """
+    Mimics the old get_country_* functions, one csv parse per lookup.
+    """
+    for number in range(LOOKUPS):
+        df_europe = pd.read_csv(df_europe_path)
+        df_europe.Size.tolist()[number]
+
+
+def lookup_with_catalog():
+    """
+    Same lookups served from the loaded-once catalog.
+    """
+    for number in range(LOOKUPS):
+        get_country(number).size
+
+
+if __name__ == "__main__":
+    old = timeit.timeit(lookup_with_read_csv, number=ROUNDS) / ROUNDS
+    new = timeit.timeit(lookup_with_catalog, number=ROUNDS) / ROUNDS
+    print(f"read_csv per request: {old * 1000:.3f} ms")
+    print(f"catalog per request:  {new * 1000:.3f} ms")
+    print(f"speedup: {old / new:,.0f}x")
@@ -0,0 +1,97 @@
+"""
+Simulates a login burst and times a light request running next to it, with bcrypt run inline
+on every request thread and through the hashing service's bounded pool.
+Also shows the calibrated work factor and how many logins the queue turns away.
+Run from the project root: python -m flasktest.playground.hashing_benchmark
+"""
+
+import os
+import statistics
+import threading
+import time
+
+import bcrypt
+
+from flasktest.users.hashing import HashingService, HashingBusy, calibrate_rounds
+
+LOGINS = 48
+LOGIN_THREADS = 16  # request threads serving the burst
+LIGHT_REQUESTS = 50  # timed when idle, during a burst they run until it is over
+WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+
+def light_request():
+    """
+    Returns the seconds(float) a small piece of pure python work took, like rendering a page.
+    """
+    start = time.perf_counter()
+    sum(number * number for number in range(20_000))
+    return time.perf_counter() - start
+
+
+def run_burst(check):
+    """
+    Takes a check function verifying one password.
+    Runs LOGINS checks on LOGIN_THREADS threads while timing light requests.
+    Returns the light request latencies(list), the burst seconds(float) and rejected logins(int).
+    """
+    password_hash = bcrypt.hashpw(b"test1234", bcrypt.gensalt(rounds))
+    remaining = list(range(LOGINS))
+    rejected = []
+    lock = threading.Lock()
+
+    def serve_logins():
+        while True:
+            with lock:
+                if not remaining:
+                    return
+                remaining.pop()
+            try:
+                check(password_hash, "test1234")
+            except HashingBusy:
+                with lock:
+                    rejected.append(1)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=serve_logins) for _ in range(LOGIN_THREADS)]
+    for thread in threads:
+        thread.start()
+
+    latencies = []
+    while any(thread.is_alive() for thread in threads):
+        latencies.append(light_request())
+        time.sleep(0.01)
+
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start, len(rejected)
+
+
+def print_result(label, latencies, seconds, rejected):
+    """
+    Takes a label(str) and the results of run_burst and prints them on one line.
+    """
+    latencies = sorted(latencies)
+    print(f"{label:<22} light request p50 {statistics.median(latencies) * 1000:6.1f} ms,"
+          f" p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.1f} ms,"
+          f" burst {seconds:5.1f} s, rejected {rejected}")
+
+
+if __name__ == "__main__":
+    rounds = calibrate_rounds()
+    print(f"calibrated work factor: {rounds}, {os.cpu_count()} cpus, {WORKERS} hashing workers")
+
+    idle = [light_request() for _ in range(LIGHT_REQUESTS)]
+    print(f"{'idle':<22} light request p50 {statistics.median(idle) * 1000:6.1f} ms")
+
+    print_result("inline bcrypt", *run_burst(
+        lambda password_hash, password: bcrypt.checkpw(password.encode(), password_hash)))
+
+    service = HashingService(workers=WORKERS, rounds=rounds)
+    print_result("hashing service", *run_burst(service.check))
+    print(f"service stats: {service.get_stats()}")
+    service.shutdown()
+
+    small_queue = HashingService(workers=WORKERS, queue=2, queue_wait=0.05, rounds=rounds)
+    print_result("service, queue of 2", *run_burst(small_queue.check))
+    small_queue.shutdown()
@@ -0,0 +1,91 @@
+"""
+Times the per-request lookups at 1M users, each with a countries row and a wordle game, without
+and with the user_id indexes, and shows which hot queries the query plan check flags.
+Fills the app database, so point SQLITE_URI at an empty scratch directory.
+Run from the project root:
+SQLITE_URI=$(mktemp -d) python -m flasktest.playground.index_benchmark
+"""
+
+import random
+import time
+
+from sqlalchemy import insert, select
+
+from flasktest import app, db
+from flasktest.models import User, CountriesData, WordleData, provision_users, \
+    select_request_user, select_latest_wordle
+from flasktest.migrations import check_query_plans
+
+USERS = 1_000_000
+READS = 200
+USER_ID_INDEXES = ("ix_countries_data_user_id", "ix_wordle_data_user_id_id")
+
+# lookup: function taking a user_id(int) and returning its statement
+lookups = {
+    "user by email": lambda user_id: select(User).where(User.email == f"user{user_id}@example.com"),
+    "countries by user": lambda user_id: select(CountriesData)
+    .where(CountriesData.user_id == user_id),
+    "last wordle by user": lambda user_id: select(WordleData)
+    .where(WordleData.id == select_latest_wordle(user_id)),
+    "user with countries": lambda user_id: select_request_user(user_id, ("countries",)),
+    "user with last wordle": lambda user_id: select_request_user(user_id, ("wordle",)),
+}
+
+
+def create_users():
+    """
+    Fills the database with USERS users, their countries state and one wordle game each.
+    """
+    provision_users({"email": f"user{number}@example.com", "username": f"user{number}",
+                     "hashed_password": b"not used"} for number in range(1, USERS + 1))
+    db.session.execute(insert(WordleData), [
+        {"user_id": user_id, "wordle_answer": "CRANE", "wordle_round": 0,
+         "wordle_game_state": "busy"}
+        for user_id in range(1, USERS + 1)
+    ])
+    db.session.commit()
+
+
+def time_lookups(users):
+    """
+    Takes a list of user ids.
+    Returns a dict of lookup(str): average seconds(float) per lookup.
+    """
+    timings = {}
+    for name, lookup in lookups.items():
+        start = time.perf_counter()
+        for user_id in users:
+            db.session.execute(lookup(user_id)).all()
+        timings[name] = (time.perf_counter() - start) / len(users)
+    return timings
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        if User.query.first() is not None:
+            raise SystemExit("There are users already, point SQLITE_URI at a scratch directory")
+
+        start = time.perf_counter()
+        create_users()
+        print(f"created {USERS:,} users in {time.perf_counter() - start:.1f} s")
+        users = [random.randint(1, USERS) for _ in range(READS)]
+
+        indexes = [index for table in db.metadata.sorted_tables for index in table.indexes
+                   if index.name in USER_ID_INDEXES]
+        for index in indexes:
+            index.drop(db.engine)
+        _, full_scans = check_query_plans()
+        print(f"without user_id indexes, full scans in: {', '.join(full_scans)}")
+        before = time_lookups(users[:5])
+
+        start = time.perf_counter()
+        for index in indexes:
+            index.create(db.engine)
+        print(f"user_id indexes built in {time.perf_counter() - start:.1f} s")
+        _, full_scans = check_query_plans()
+        print(f"with user_id indexes, full scans in: {', '.join(full_scans) or 'none'}")
+        after = time_lookups(users)
+
+    print(f"{'lookup':<22} {'no index':>10} {'indexed':>10}")
+    for name in lookups:
+        print(f"{name:<22} {before[name] * 1000:8.3f}ms {after[name] * 1000:8.3f}ms")
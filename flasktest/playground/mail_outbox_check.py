@@ -0,0 +1,99 @@
+"""
+Runs the mail outbox against the local SMTP stub: a password reset request, a batch of queued
+emails sent over one connection, temporary server errors retried with backoff and an email that
+cannot be sent given up on.
+Uses the app database, so point SQLITE_URI at an empty scratch directory.
+Run from the project root:
+SQLITE_URI=$(mktemp -d) python -m flasktest.playground.mail_outbox_check
+"""
+
+import os
+import time
+
+from flasktest import app, db
+from flasktest.models import MailOutbox
+from flasktest.users.mail import MailSender, queue_mail, mail_sender
+from flasktest.playground.smtp_stub_server import SmtpStub
+
+EMAILS = 50
+FAILURES = 3
+
+
+def wait_for_outbox(timeout=15):
+    """
+    Waits until no email is queued or sending, at most timeout seconds.
+    Returns the seconds(float) it took.
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        with app.app_context():
+            if not MailOutbox.query.filter(MailOutbox.status.in_(("queued", "sending"))).count():
+                break
+        time.sleep(0.05)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        if MailOutbox.query.first() is not None:
+            raise SystemExit("The outbox is not empty, point SQLITE_URI at a scratch directory")
+
+    stub = SmtpStub(port=0).start()
+    host = f"localhost:{stub.server_address[1]}"
+
+    # Password reset through the route, with the apps sender pointed at the stub
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    mail_sender.host, mail_sender.starttls = host, False
+    client = app.test_client()
+    client.get("/fresh")
+    start = time.perf_counter()
+    response = client.post("/request-reset", data={"email": os.environ["TEST_EMAIL"]})
+    route_time = time.perf_counter() - start
+    assert response.status_code == 302, f"request-reset returned {response.status_code}"
+    wait_for_outbox()
+    mail_sender.stop()
+    assert "Your reset code" in stub.messages[-1][1], "reset code was not delivered"
+    print(f"request-reset answered in {route_time * 1000:.1f} ms, code delivered")
+
+    # A batch over one connection
+    sender = MailSender(host, "user", "password", "noreply@example.com", starttls=False,
+                        batch_size=20, retry_base=0.2, poll_interval=0.5)
+    connections = stub.counters["connections"]
+    with app.app_context():
+        for number in range(EMAILS):
+            queue_mail(f"player{number}@example.com", "Outbox check", f"Email {number}")
+        db.session.commit()
+    sender.wake()
+    batch_time = wait_for_outbox()
+    print(f"{EMAILS} emails sent in {batch_time:.2f} s over"
+          f" {stub.counters['connections'] - connections} connection(s)")
+    assert sender.stats["sent"] == EMAILS
+
+    # Temporary errors are retried with backoff
+    stub.failures = FAILURES
+    with app.app_context():
+        queue_mail("retry@example.com", "Outbox check", "Retried email")
+        db.session.commit()
+    sender.wake()
+    retry_time = wait_for_outbox()
+    sender.stop()
+    with app.app_context():
+        message = MailOutbox.query.filter_by(to_addr="retry@example.com").first()
+        print(f"email sent after {message.attempts} failed attempts in {retry_time:.2f} s,"
+              f" status {message.status}")
+        assert message.status == "sent" and message.attempts == FAILURES
+
+    # An email the sender cannot build, a header with a line break, fails after max_attempts
+    with app.app_context():
+        queue_mail("broken@example.com", "Outbox\ncheck", "Broken email")
+        db.session.commit()
+    sender.wake()
+    broken_time = wait_for_outbox()
+    sender.stop()
+    with app.app_context():
+        message = MailOutbox.query.filter_by(to_addr="broken@example.com").first()
+        print(f"unsendable email {message.status} after {message.attempts} attempts"
+              f" in {broken_time:.2f} s: {message.error}")
+        assert message.status == "failed" and message.attempts == sender.max_attempts
+    print(f"sender stats: {dict(sender.stats)}")
+    stub.shutdown()
@@ -0,0 +1,65 @@
+"""
+Times recomputing the per game metrics for every player in the stats store: one frame per
+player as the pubg page builds them, against one read_all_stats frame in a single NumPy pass.
+Fills the stats store, so point SQLITE_URI at an empty scratch directory.
+Run from the project root:
+SQLITE_URI=$(mktemp -d) python -m flasktest.playground.metrics_benchmark
+"""
+
+import time
+
+import numpy as np
+from sqlalchemy import insert
+
+from flasktest import app, db
+from flasktest.models import PubgSeasonStats
+from flasktest.apis.metrics import add_metric_columns, metric_registry
+from flasktest.apis.stats_store import stats_columns, read_csv_stats, read_player_stats, \
+    read_all_stats
+from flasktest.apis.utils import build_player_dataframe
+
+PLAYERS = 10_000
+GAME_MODE = "solo-fpp"
+
+
+def create_players():
+    """
+    Fills the stats store with PLAYERS copies of the example player.
+    """
+    player_stats = read_csv_stats("flasktest/static/data/api/pubg/df_hambinooo_solo_fpp.csv")
+    db.session.execute(insert(PubgSeasonStats), [
+        dict(zip(stats_columns, season_stats), player=f"player{player}", game_mode=GAME_MODE,
+             position=position, finalized=position > 0, fetched=0)
+        for player in range(PLAYERS)
+        for position, season_stats in enumerate(zip(*player_stats))
+    ])
+    db.session.commit()
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        if PubgSeasonStats.query.first() is not None:
+            raise SystemExit("The stats store has rows, point SQLITE_URI at a scratch directory")
+        create_players()
+
+        start = time.perf_counter()
+        player_frames = [build_player_dataframe(read_player_stats(f"player{player}", GAME_MODE)[0])
+                         for player in range(PLAYERS)]
+        per_player_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        all_stats = read_all_stats()
+        read_time = time.perf_counter() - start
+        start = time.perf_counter()
+        all_metrics = add_metric_columns(all_stats)
+        compute_time = time.perf_counter() - start
+
+    # Both paths order seasons newest first, so the bulk frame is the player frames stacked
+    metrics = list(metric_registry)
+    bulk = all_metrics[all_metrics.player == "player0"][metrics].to_numpy()
+    assert np.allclose(bulk, player_frames[0][metrics].to_numpy()), "bulk metrics differ"
+
+    print(f"{PLAYERS:,} players, {len(all_stats):,} seasons")
+    print(f"per player frames:         {per_player_time:6.2f} s")
+    print(f"read_all_stats + one pass: {read_time + compute_time:6.2f} s"
+          f" (read {read_time:.2f} s, metrics {compute_time * 1000:.1f} ms)")
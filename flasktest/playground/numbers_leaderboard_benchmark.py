@@ -0,0 +1,88 @@
+"""
+Times the numbers page leaderboards at 1M recorded games: the old ORDER BY queries without
+indexes, the same queries with the numbers indexes, and the in-memory leaderboard.
+Fills and drops indexes in the app database, so point SQLITE_URI at an empty scratch directory.
+Run from the project root:
+SQLITE_URI=$(mktemp -d) python -m flasktest.playground.numbers_leaderboard_benchmark
+"""
+
+import random
+import time
+
+from sqlalchemy import insert
+
+from flasktest import app, db
+from flasktest.models import NumbersData
+from flasktest.games.leaderboard import NumbersLeaderboard, select_best_times
+
+GAMES = 1_000_000
+USERS = 10_000
+READS = 200
+
+
+def create_games():
+    """
+    Fills the NumbersData table with GAMES finished games.
+    """
+    rows = []
+    for _ in range(GAMES):
+        start = random.uniform(1.6e9, 1.7e9)
+        numbers_time = round(random.uniform(2, 30), 4)
+        rows.append({"user_id": random.randint(1, USERS), "numbers_start": start,
+                     "numbers_stop": start + numbers_time, "numbers_time": numbers_time})
+    db.session.execute(insert(NumbersData), rows)
+    db.session.commit()
+
+
+def time_queries(users):
+    """
+    Takes a list of user ids.
+    Returns the average seconds(float) to query the global and a personal board per user.
+    """
+    start = time.perf_counter()
+    for user_id in users:
+        db.session.execute(select_best_times()).all()
+        db.session.execute(select_best_times(user_id)).all()
+    return (time.perf_counter() - start) / len(users)
+
+
+def time_leaderboard(leaderboard, users):
+    """
+    Takes a leaderboard(class) and a list of user ids.
+    Returns the average seconds(float) to get the global and a personal board per user.
+    """
+    start = time.perf_counter()
+    for user_id in users:
+        leaderboard.get_global()
+        leaderboard.get_personal(user_id)
+    return (time.perf_counter() - start) / len(users)
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        if NumbersData.query.first() is not None:
+            raise SystemExit("NumbersData is not empty, point SQLITE_URI at a scratch directory")
+
+        for index in NumbersData.__table__.indexes:
+            index.drop(db.engine)
+        create_games()
+        users = [random.randint(1, USERS) for _ in range(READS)]
+
+        scan_time = time_queries(users[:10])
+
+        start = time.perf_counter()
+        for index in NumbersData.__table__.indexes:
+            index.create(db.engine)
+        index_build_time = time.perf_counter() - start
+        index_time = time_queries(users)
+
+        leaderboard = NumbersLeaderboard()
+        first_time = time_leaderboard(leaderboard, users)
+        cached_time = time_leaderboard(leaderboard, users)
+
+    print(f"{GAMES:,} games by {USERS:,} users, global and personal board per page view")
+    print(f"ORDER BY, no indexes:  {scan_time * 1000:8.3f} ms")
+    print(f"ORDER BY, indexed:     {index_time * 1000:8.3f} ms"
+          f" (indexes built in {index_build_time:.1f} s)")
+    print(f"leaderboard, 1st view: {first_time * 1000:8.3f} ms")
+    print(f"leaderboard, cached:   {cached_time * 1000:8.3f} ms")
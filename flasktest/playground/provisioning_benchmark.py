@@ -0,0 +1,64 @@
+"""
+Times creating accounts the old way (email lookup, then the user and its countries state in
+two commits), with provision_user in one transaction, and in bulk with provision_users.
+Fills the app database, so point SQLITE_URI at an empty scratch directory.
+Run from the project root:
+SQLITE_URI=$(mktemp -d) python -m flasktest.playground.provisioning_benchmark
+"""
+
+import time
+
+from flasktest import app, db
+from flasktest.models import User, add_new_countries, provision_user, provision_users
+
+SIGNUPS = 500
+BULK_USERS = 100_000
+HASHED_PASSWORD = b"$2b$12$benchmark.password.hash.not.used.for.login"
+
+
+def old_signup(email, username):
+    """
+    Takes an email(str) and username(str) and registers them the way the app used to.
+    """
+    if User.query.filter_by(email=email).first():
+        return
+    # noinspection PyArgumentList
+    new_user = User(email=email, username=username, password=HASHED_PASSWORD, reset_key=0)
+    db.session.add(new_user)
+    db.session.commit()
+    db.session.add(add_new_countries(user_id=new_user.id))
+    db.session.commit()
+
+
+def time_signups(signup, prefix):
+    """
+    Takes a signup function and an email prefix(str).
+    Returns the average seconds(float) per signup over SIGNUPS signups.
+    """
+    start = time.perf_counter()
+    for number in range(SIGNUPS):
+        signup(f"{prefix}{number}@example.com", f"{prefix}{number}")
+    return (time.perf_counter() - start) / SIGNUPS
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        if User.query.first() is not None:
+            raise SystemExit("There are users already, point SQLITE_URI at a scratch directory")
+
+        old_time = time_signups(old_signup, "old")
+        new_time = time_signups(
+            lambda email, username: provision_user(email, username, HASHED_PASSWORD), "new")
+
+        start = time.perf_counter()
+        provision_users({"email": f"bulk{number}@example.com", "username": f"bulk{number}",
+                         "hashed_password": HASHED_PASSWORD} for number in range(BULK_USERS))
+        bulk_time = time.perf_counter() - start
+
+        duplicate = provision_user("new0@example.com", "again", HASHED_PASSWORD)
+
+    print(f"old signup, 2 commits:     {old_time * 1000:6.2f} ms per user")
+    print(f"provision_user, 1 commit:  {new_time * 1000:6.2f} ms per user")
+    print(f"provision_users:           {bulk_time:6.2f} s for {BULK_USERS:,} users"
+          f" ({BULK_USERS / bulk_time:,.0f} per second)")
+    print(f"duplicate email returned {duplicate}")
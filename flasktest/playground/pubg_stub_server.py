@@ -0,0 +1,76 @@
+"""
+Local stand-in for the pubg api, used to exercise the season fetcher without spending quota.
+Start it, then run the app with PUBG_API_URL=http://localhost:8001
+"""
+
+import json
+import random
+import re
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PORT = 8001
+LATENCY = 0.3  # seconds added to every response
+SEASONS = [f"division.bro.official.pc-2018-{number:02}" for number in range(1, 23)]
+SEASONS_ETAG = '"seasons-v1"'
+GAME_MODES = ["solo", "solo-fpp", "duo", "duo-fpp", "squad", "squad-fpp"]
+
+
+def create_mode_stats():
+    """
+    Returns random stats(dict) for a single game mode.
+    """
+    rounds_played = random.choice([0, 3, 20, 50, 85])
+    return {
+        "assists": random.randint(0, rounds_played),
+        "damageDealt": random.uniform(0, 700) * rounds_played,
+        "kills": random.randint(0, 5 * rounds_played),
+        "headshotKills": random.randint(0, 2 * rounds_played),
+        "roundMostKills": random.randint(0, 20),
+        "rideDistance": random.uniform(0, 1500) * rounds_played,
+        "top10s": random.randint(0, rounds_played),
+        "roundsPlayed": rounds_played,
+        "wins": random.randint(0, rounds_played // 5),
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers the three pubg endpoints used by apis/utils.py.
+    """
+    def do_GET(self):
+        time.sleep(LATENCY)
+
+        if self.path.startswith("/shards/steam/players?"):
+            name = self.path.split("=")[-1]
+            if name == "unknown":
+                return self.send_json(404, {"errors": [{"title": "Not Found"}]})
+            return self.send_json(200, {"data": [{"id": f"account.{name}"}]})
+
+        if self.path == "/shards/steam/seasons":
+            if self.headers.get("If-None-Match") == SEASONS_ETAG:
+                return self.send_json(304, None)
+            return self.send_json(200, {"data": [{"id": season} for season in SEASONS]},
+                                  etag=SEASONS_ETAG)
+
+        if re.match(r"^/shards/steam/players/[^/]+/seasons/[^/?]+", self.path):
+            modes = {mode: create_mode_stats() for mode in GAME_MODES}
+            return self.send_json(200, {"data": {"attributes": {"gameModeStats": modes}}})
+
+        return self.send_json(404, {"errors": [{"title": "Not Found"}]})
+
+    def send_json(self, status_code, body, etag=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/vnd.api+json")
+        self.send_header("Content-Length", str(len(payload)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+if __name__ == "__main__":
+    print(f"pubg stub listening on http://localhost:{PORT}")
+    ThreadingHTTPServer(("", PORT), StubHandler).serve_forever()
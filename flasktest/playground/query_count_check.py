@@ -0,0 +1,60 @@
+"""
+Plays the games through the test client and checks how many SQL statements each step
+sends, failing when a change adds round trips.
+Creates the test users in the app database, so point SQLITE_URI at an empty scratch directory.
+Run from the project root:
+SQLITE_URI=$(mktemp -d) python -m flasktest.playground.query_count_check
+"""
+
+import os
+
+from flasktest import app
+from flasktest.models import User
+
+# step: (method, url, form data, most statements allowed with warm leaderboards)
+# The user and the game rows a route reads are loaded in one query, see load_request_user
+game_steps = {
+    "countries view": ("GET", "/games/countries", None, 1),
+    # load user and game, update game, upsert scores, reload the committed game
+    "countries guess": ("POST", "/games/countries", {"select": "Larger"}, 4),
+    "wordle start": ("GET", "/games/play-wordle", None, 2),  # load user and game, insert game
+    "wordle view": ("GET", "/games/play-wordle", None, 1),
+    "wordle guess": ("POST", "/games/play-wordle", {"guess": "CRANE"}, 2),  # update game
+    "wordle hint": ("GET", "/games/wordle/hint", None, 1),
+    "numbers start": ("GET", "/games/numbers", None, 2),  # load user, upsert game
+    "numbers restart": ("GET", "/games/numbers", None, 2),
+    "numbers stop": ("POST", "/games/numbers", {"submit": "Stop"}, 4),  # game, time, scores
+    "numbers start again": ("GET", "/games/numbers", None, 2),
+}
+
+
+def get_query_count(client, method, url, data=None):
+    """
+    Takes a test client, a method(str), url(str) and form data(dict).
+    Returns the number(int) of statements the request executed.
+    """
+    response = client.open(url, method=method, data=data)
+    assert response.status_code == 200, f"{method} {url} returned {response.status_code}"
+    return int(response.headers["X-Query-Count"])
+
+
+if __name__ == "__main__":
+    with app.app_context():
+        if User.query.first() is not None:
+            raise SystemExit("There are users already, point SQLITE_URI at a scratch directory")
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    client.get("/fresh")
+    client.post("/login", data={"email": os.environ["TEST_EMAIL"], "password": "test1234"})
+    # Warm the leaderboards, a cold board costs one more query each
+    get_query_count(client, "GET", "/games/numbers")
+
+    failures = 0
+    for step, (method, url, data, allowed) in game_steps.items():
+        count = get_query_count(client, method, url, data)
+        result = "ok" if count <= allowed else "TOO MANY"
+        failures += count > allowed
+        print(f"{step:<20} {count} queries (allowed {allowed}) {result}")
+
+    assert not failures, f"{failures} steps made too many queries"
@@ -0,0 +1,54 @@
+"""
+Hammers one shared pubg quota from several processes at once, to check that no token is spent
+twice and to time a quota transaction under contention.
+Run from the project root: python -m flasktest.playground.quota_benchmark
+"""
+
+import os
+import tempfile
+import time
+
+from multiprocessing import Pool
+
+from sqlalchemy import create_engine
+
+from flasktest.models import APIQuota
+from flasktest.apis.quota import SharedTokenBucket
+
+PROCESSES = 8
+SECONDS = 3
+RATE = 10  # tokens per PER seconds
+PER = 1
+
+
+def hammer(database):
+    """
+    Takes the database(str) path and keeps taking tokens for SECONDS.
+    Returns the number(int) of tokens taken and of attempts made.
+    """
+    bucket = SharedTokenBucket(api_name="pubg", rate=RATE, per=PER, database=database)
+    taken = attempts = 0
+    end = time.time() + SECONDS
+    while time.time() < end:
+        attempts += 1
+        if not bucket.try_acquire():
+            taken += 1
+    return taken, attempts
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database = os.path.join(temp_dir, "quota.db")
+        APIQuota.__table__.create(create_engine(f"sqlite:///{database}"))
+
+        start = time.time()
+        with Pool(PROCESSES) as pool:
+            results = pool.map(hammer, [database] * PROCESSES)
+        elapsed = time.time() - start
+
+    taken = sum(result[0] for result in results)
+    attempts = sum(result[1] for result in results)
+    allowed = RATE + RATE / PER * elapsed
+    print(f"{PROCESSES} processes for {SECONDS}s, bucket of {RATE} per {PER}s")
+    print(f"tokens taken: {taken}, at most allowed: {allowed:.1f}")
+    print(f"{attempts:,} attempts, {elapsed / attempts * PROCESSES * 1000:.3f} ms per attempt")
@@ -0,0 +1,108 @@
+"""
+Local stand-in for the SMTP server, used to exercise the mail outbox without sending email.
+Speaks just enough SMTP for smtplib: EHLO, AUTH, MAIL, RCPT, DATA, RSET, NOOP and QUIT,
+without STARTTLS. Any SMTP test server such as aiosmtpd works the same way.
+Start it, then run the app with GMAIL_SMTP=localhost:8025, or import SmtpStub in a script.
+"""
+
+import threading
+
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+PORT = 8025
+
+
+class SmtpHandler(StreamRequestHandler):
+    """
+    Answers one SMTP connection and hands finished messages to the server.
+    """
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.count("connections")
+        self.reply("220 smtp stub ready")
+        recipients = []
+        for raw_line in self.rfile:
+            command = raw_line.decode().strip()
+            verb = command.split(" ")[0].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.reply("250-smtp stub")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                self.reply("235 Authentication successful")
+            elif verb == "MAIL":
+                if self.server.take_failure():
+                    self.reply("451 Try again later")
+                else:
+                    recipients = []
+                    self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data_line in self.rfile:
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data_line.decode())
+                self.server.receive(recipients, "".join(lines))
+                self.reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SmtpStub(ThreadingTCPServer):
+    """
+    Class containing the stub server, the messages it received and its counters.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=PORT, verbose=False):
+        super().__init__(("localhost", port), SmtpHandler)
+        self.verbose = verbose
+        self.messages = []  # (recipients, message text)
+        self.counters = {"connections": 0}
+        self.failures = 0  # next MAIL commands answered with a temporary error
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"SmtpStub(messages={len(self.messages)}, counters={self.counters})"
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def take_failure(self):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                return True
+            return False
+
+    def receive(self, recipients, text):
+        with self.lock:
+            self.messages.append((recipients, text))
+        if self.verbose:
+            print(f"to {', '.join(recipients)}:\n{text}")
+
+    def start(self):
+        """
+        Serves on a background thread.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    print(f"smtp stub listening on localhost:{PORT}")
+    with SmtpStub(verbose=True) as server:
+        server.serve_forever()
@@ -0,0 +1,66 @@
+"""
+Compares reading a player's stats from per player csv files against the stats store.
+Builds 10k players of each in a temporary directory, then times random reads.
+Run from the project root: python -m flasktest.playground.stats_store_benchmark
+"""
+
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, insert
+
+from flasktest.models import PubgSeasonStats
+from flasktest.apis.stats_store import select_player_stats, stats_columns, read_csv_stats
+
+PLAYERS = 10_000
+READS = 2_000
+df_example = pd.read_csv("flasktest/static/data/api/pubg/df_hambinooo_solo_fpp.csv")
+
+
+def create_players(temp_dir):
+    """
+    Takes a temp_dir(str) and fills it with PLAYERS csv files and a stats store database.
+    Returns the store's engine.
+    """
+    engine = create_engine(f"sqlite:///{os.path.join(temp_dir, 'stats.db')}")
+    PubgSeasonStats.__table__.create(engine)
+    player_stats = read_csv_stats("flasktest/static/data/api/pubg/df_hambinooo_solo_fpp.csv")
+
+    rows = []
+    for player in range(PLAYERS):
+        df_example.to_csv(os.path.join(temp_dir, f"df_player{player}_solo_fpp.csv"), index=False)
+        rows.extend(
+            dict(zip(stats_columns, season_stats), player=f"player{player}",
+                 game_mode="solo-fpp", position=position, fetched=0)
+            for position, season_stats in enumerate(zip(*player_stats))
+        )
+
+    with engine.begin() as connection:
+        connection.execute(insert(PubgSeasonStats), rows)
+    return engine
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as temp_dir:
+        engine = create_players(temp_dir)
+        players = [f"player{random.randrange(PLAYERS)}" for _ in range(READS)]
+
+        start = time.perf_counter()
+        for player in players:
+            path = os.path.join(temp_dir, f"df_{player}_solo_fpp.csv")
+            if os.path.exists(path):
+                pd.read_csv(path)
+        csv_time = (time.perf_counter() - start) / READS
+
+        start = time.perf_counter()
+        with engine.connect() as connection:
+            for player in players:
+                connection.execute(select_player_stats(player, "solo-fpp")).all()
+        store_time = (time.perf_counter() - start) / READS
+
+    print(f"{PLAYERS:,} players, {READS:,} random reads")
+    print(f"csv files:   {csv_time * 1000:.3f} ms per read")
+    print(f"stats store: {store_time * 1000:.3f} ms per read")
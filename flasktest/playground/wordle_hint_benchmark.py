@@ -0,0 +1,58 @@
+"""
+Compares answering wordle hints by rescanning the whole dictionary against the bitset index,
+checking that both agree, on random games of zero to four guesses.
+Run from the project root: python -m flasktest.playground.wordle_hint_benchmark
+"""
+
+import random
+import time
+
+from flasktest.games.utils import wordle_words, wordle_hints
+from flasktest.games.scoring import score_pattern, pattern_to_mask
+
+GAMES = 300
+
+
+def rescan_candidates(guesses, masks):
+    """
+    Takes the guesses(list) of a game and their color masks(list).
+    Returns every dictionary word(str) that would have given the same colors.
+    """
+    return [word for word in wordle_words
+            if all(pattern_to_mask(score_pattern(guess, word)) == mask
+                   for guess, mask in zip(guesses, masks))]
+
+
+if __name__ == "__main__":
+    words = list(wordle_words)
+    games = []
+    for _ in range(GAMES):
+        answer = random.choice(words)
+        guesses = random.sample(words, random.randint(0, 4))
+        games.append((guesses, [pattern_to_mask(score_pattern(guess, answer))
+                                for guess in guesses]))
+
+    rescan_times = []
+    bitset_times = []
+    mismatches = 0
+    for guesses, masks in games:
+        start = time.perf_counter()
+        candidates = rescan_candidates(guesses, masks)
+        rescan_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        hint = wordle_hints.get_hint("".join(guesses), "".join(masks))
+        bitset_times.append(time.perf_counter() - start)
+
+        if hint["candidates"] != len(candidates) or not set(hint["sample"]) <= set(candidates):
+            mismatches += 1
+
+    rescan_times.sort()
+    bitset_times.sort()
+    print(f"{len(words):,} words, {GAMES} random games")
+    print(f"rescan: median {rescan_times[GAMES // 2] * 1000:8.3f} ms,"
+          f" p95 {rescan_times[GAMES * 95 // 100] * 1000:8.3f} ms")
+    print(f"bitset: median {bitset_times[GAMES // 2] * 1000:8.3f} ms,"
+          f" p95 {bitset_times[GAMES * 95 // 100] * 1000:8.3f} ms (with best guess)")
+    print(f"pattern matrix loaded: {wordle_hints.patterns.matrix is not None}")
+    print(f"mismatches: {mismatches}")
@@ -0,0 +1,64 @@
+"""
+Compares scoring wordle guesses with the old per round loop, the scoring engine
+and a lookup in the precomputed pattern matrix, and counts how often the old loop
+mis-scored repeated letters.
+Run from the project root: python -m flasktest.playground.wordle_scoring_benchmark
+"""
+
+import random
+import time
+
+from flasktest.games.utils import wordle_words
+from flasktest.games.scoring import PatternMatrix, score_pattern, pattern_to_mask
+
+PAIRS = 100_000
+
+
+def old_round_data(guess, answer):
+    """
+    Takes a guess(str) and an answer(str).
+    Returns the color mask(str) the way Wordle.round1_data..round5_data used to score it.
+    """
+    mask = ""
+    for index, letter in enumerate(guess):
+        if letter == answer[index]:
+            mask += "2"
+        elif letter in answer:
+            mask += "1"
+        else:
+            mask += "0"
+    return mask
+
+
+if __name__ == "__main__":
+    words = list(wordle_words)
+    pairs = [(random.choice(words), random.choice(words)) for _ in range(PAIRS)]
+
+    start = time.perf_counter()
+    old_masks = [old_round_data(guess, answer) for guess, answer in pairs]
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine_patterns = [score_pattern(guess, answer) for guess, answer in pairs]
+    engine_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pattern_matrix = PatternMatrix(words)
+    matrix = pattern_matrix.build()
+    build_time = time.perf_counter() - start
+
+    index = pattern_matrix.index
+    start = time.perf_counter()
+    for guess, answer in pairs:
+        matrix[index[guess], index[answer]]
+    lookup_time = time.perf_counter() - start
+
+    mis_scored = sum(old_mask != pattern_to_mask(pattern)
+                     for old_mask, pattern in zip(old_masks, engine_patterns))
+
+    print(f"{len(words):,} words, {PAIRS:,} random guess/answer pairs")
+    print(f"old round loop: {PAIRS / old_time:>12,.0f} scores per second")
+    print(f"scoring engine: {PAIRS / engine_time:>12,.0f} scores per second")
+    print(f"matrix lookup:  {PAIRS / lookup_time:>12,.0f} scores per second")
+    print(f"matrix build:   {build_time:.2f} s, {matrix.nbytes / 1e6:.1f} MB")
+    print(f"old loop mis-scored {mis_scored:,} pairs ({mis_scored / PAIRS:.2%})")
@@ -0,0 +1,41 @@
+"""
+Counts the SQL statements each request sends to the database.
+In debug and testing mode the count is logged and returned in an X-Query-Count header, so
+routes that start making more round trips than they should are caught,
+see playground/query_count_check.py.
+"""
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+from flasktest import app
+
+
+def count_query(connection, cursor, statement, parameters, context, executemany):
+    """
+    Adds one to the query count of the current app context, if there is one.
+    """
+    if has_app_context():
+        g.query_count = g.get("query_count", 0) + 1
+
+
+def init_query_counter(engine):
+    """
+    Takes an engine and counts every statement it executes.
+    """
+    event.listen(engine, "before_cursor_execute", count_query)
+
+
+def get_query_count():
+    """
+    Returns the number(int) of statements executed in the current app context.
+    """
+    return g.get("query_count", 0)
+
+
+@app.after_request
+def add_query_count_header(response):
+    if app.debug or app.testing:
+        response.headers["X-Query-Count"] = str(get_query_count())
+        app.logger.debug("%s %s took %s queries", request.method, request.path, get_query_count())
+    return response
@@ -0,0 +1,78 @@
+"""
+Connection settings for the SQLite database, picked with the SQLITE_PROFILE environment variable.
+With SQLite's own settings every write takes the rollback journal lock, so readers in other
+workers wait for it and give up with "database is locked", and SQLAlchemy opens a new
+connection for every request. The "wal" profile, the default, lets readers carry on while one
+writer commits and keeps a pool of open connections per worker.
+"default" keeps SQLite's own settings, for comparison, see playground/concurrency_benchmark.py.
+"""
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool, QueuePool
+
+POOL_SIZE = 5  # open connections kept per worker
+MAX_OVERFLOW = 10  # extra connections opened under load, closed when returned
+POOL_TIMEOUT = 10  # seconds a request waits for a connection before failing
+
+# profile: pragmas set on every new connection and the engine options
+SQLITE_PROFILES = {
+    "default": {
+        # journal_mode is stored in the database file, so switching back has to set it
+        "pragmas": {"journal_mode": "DELETE", "synchronous": "FULL"},
+        # What SQLAlchemy uses for SQLite files, python's sqlite3 waits 5 seconds for locks
+        "engine_options": {"poolclass": NullPool},
+    },
+    "wal": {
+        "pragmas": {
+            "journal_mode": "WAL",  # readers see the last commit while a writer works
+            # With WAL only commits still in the log can be lost on power loss, never corrupted
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,  # milliseconds a writer waits for the write lock
+            "cache_size": -32000,  # negative is KiB, 32 MB of page cache per connection
+            "mmap_size": 256 * 1024 * 1024,  # read pages straight from the mapped file
+            "temp_store": "MEMORY",  # sorts for ORDER BY and GROUP BY
+        },
+        "engine_options": {
+            "poolclass": QueuePool,
+            "pool_size": POOL_SIZE,
+            "max_overflow": MAX_OVERFLOW,
+            "pool_timeout": POOL_TIMEOUT,
+            # Pooled connections are handed to whichever request thread checks them out
+            "connect_args": {"check_same_thread": False},
+        },
+    },
+}
+
+
+def get_sqlite_profile(name):
+    """
+    Takes a profile name(str).
+    Returns the pragmas(dict) and engine options(dict) of the profile.
+    """
+    if name not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE {name}, use one of {', '.join(SQLITE_PROFILES)}")
+    profile = SQLITE_PROFILES[name]
+    return dict(profile["pragmas"]), dict(profile["engine_options"])
+
+
+def init_sqlite_pragmas(engine, pragmas):
+    """
+    Takes an engine and the pragmas(dict) to set on every connection it opens.
+    """
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    event.listen(engine, "connect", set_pragmas)
+
+
+def get_sqlite_settings(connection):
+    """
+    Takes a connection.
+    Returns a dict of pragma(str): the value(str) the connection uses, for every profile pragma.
+    """
+    names = {name for profile in SQLITE_PROFILES.values() for name in profile["pragmas"]}
+    return {name: str(connection.exec_driver_sql(f"PRAGMA {name}").scalar())
+            for name in sorted(names)}
@@ -28,6 +28,7 @@ class RegisterForm(FlaskForm):
     """
     Register form for landing page.
     """
+    # Emails already registered are turned away by the unique index, see provision_user
     email = EmailField(label="Email",
                        render_kw={"placeholder": "Example@example.com", "autofocus": True},
                        validators=[DataRequired(message="Email is required"),
@@ -56,14 +57,6 @@ class RegisterForm(FlaskForm):
                                           EqualTo("password")])
     submit = SubmitField(label="Register")
 
-    def validate_email(self, email):
-        """"
-        Checks to see if a user with this email already exists.
-        """
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError("Email already registered")
-
 
 class LoginForm(FlaskForm):
     """
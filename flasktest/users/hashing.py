@@ -0,0 +1,219 @@
+"""
+Password hashing service.
+bcrypt runs in a small process pool instead of on the request threads, so a burst of logins
+keeps at most HASH_WORKERS cores busy and the other routes stay responsive. Callers beyond
+HASH_QUEUE waiting hashes are turned away with HashingBusy instead of piling up.
+The work factor comes from BCRYPT_ROUNDS, else it is calibrated once to take about
+HASH_TARGET_SECONDS on this machine and saved, so every worker uses the same one.
+Hashes made with a lower work factor are flagged so they can be redone on login.
+"""
+
+import math
+import multiprocessing
+import os
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+HASH_WORKERS = 2
+HASH_QUEUE = 16  # hashes allowed to wait for a worker before callers are turned away
+HASH_QUEUE_WAIT = 2  # seconds a caller waits for a place in the queue
+HASH_TARGET_SECONDS = 0.25
+MIN_ROUNDS = 12  # Flask-Bcrypt's default, new hashes are never weaker than the old ones
+MAX_ROUNDS = 16
+ROUNDS_FILE = "flasktest/cache/bcrypt_rounds"  # the calibrated work factor shared by workers
+CALIBRATION_ROUNDS = 8  # cheap enough to time on every start
+LATENCY_SAMPLES = 1000  # latencies kept per operation for the percentiles
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing queue is full.
+    """
+
+
+def get_rounds(password_hash):
+    """
+    Takes a bcrypt password_hash(bytes or str) such as $2b$12$...
+    Returns its work factor(int).
+    """
+    if isinstance(password_hash, bytes):
+        password_hash = password_hash.decode("ascii")
+    return int(password_hash.split("$")[2])
+
+
+def calibrate_rounds(target_seconds=HASH_TARGET_SECONDS):
+    """
+    Takes the target_seconds(float) one hash should take.
+    Returns the work factor(int) closest to it, each extra round doubling the time,
+    kept between MIN_ROUNDS and MAX_ROUNDS.
+    """
+    salt = bcrypt.gensalt(CALIBRATION_ROUNDS)
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", salt)
+        timings.append(time.perf_counter() - start)
+
+    rounds = CALIBRATION_ROUNDS + round(math.log2(target_seconds / min(timings)))
+    return max(MIN_ROUNDS, min(MAX_ROUNDS, rounds))
+
+
+def load_rounds(target_seconds=HASH_TARGET_SECONDS, path=ROUNDS_FILE):
+    """
+    Takes the target_seconds(float) one hash should take and the path(str) of the rounds file.
+    Returns the work factor(int) set in BCRYPT_ROUNDS, else the one saved in the rounds file,
+    calibrating and saving it first when no worker has yet.
+    """
+    if os.environ.get("BCRYPT_ROUNDS"):
+        return int(os.environ["BCRYPT_ROUNDS"])
+    try:
+        with open(path) as file:
+            return int(file.read())
+    except FileNotFoundError:
+        pass
+
+    rounds = calibrate_rounds(target_seconds)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as file:
+        file.write(str(rounds))
+    try:
+        # Only publishes a complete file, and only if no other worker has saved one
+        os.link(temp_path, path)
+    except FileExistsError:
+        with open(path) as file:
+            rounds = int(file.read())
+    finally:
+        os.remove(temp_path)
+    return rounds
+
+
+class HashingService:
+    """
+    Class containing the hashing pool, its queue limit and the latency counters.
+    """
+    def __init__(self, workers=HASH_WORKERS, queue=HASH_QUEUE, queue_wait=HASH_QUEUE_WAIT,
+                 target_seconds=HASH_TARGET_SECONDS, rounds=None):
+        self.workers = workers
+        self.queue_wait = queue_wait
+        self.target_seconds = target_seconds
+        self.rounds = rounds  # loaded on first use when None, see load_rounds
+        self.executor = None
+        self.slots = threading.BoundedSemaphore(workers + queue)
+        self.lock = threading.Lock()
+        self.stats = {}  # operation: {"count", "seconds", "latencies"}
+        self.rejected = 0
+
+    def __repr__(self):
+        return f"HashingService(workers={self.workers}, rounds={self.rounds})"
+
+    def get_executor(self):
+        """
+        Returns the process pool, started on first use.
+        Also loads the work factor then if none was given.
+        """
+        with self.lock:
+            if self.rounds is None:
+                self.rounds = load_rounds(self.target_seconds)
+            if self.executor is None:
+                # Forking this process, which already runs request, job and mail threads,
+                # could copy a lock one of them holds, so workers start from a fork server.
+                # It preloads only bcrypt, the workers never import the app, see run.py
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["bcrypt"])
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self.executor
+
+    def run(self, operation, function, *args):
+        """
+        Takes an operation(str) name used for the counters, and a bcrypt function and its args
+        to run in the pool once there is room in the queue.
+        Returns the function's result.
+        Raises HashingBusy when the queue stays full for queue_wait seconds.
+        """
+        executor = self.get_executor()
+        start = time.perf_counter()
+        if not self.slots.acquire(timeout=self.queue_wait):
+            with self.lock:
+                self.rejected += 1
+            raise HashingBusy("Too many password checks at once")
+
+        try:
+            result = executor.submit(function, *args).result()
+        finally:
+            self.slots.release()
+        self.record(operation, time.perf_counter() - start)
+        return result
+
+    def hash(self, password):
+        """
+        Takes a password(str).
+        Returns its bcrypt hash(bytes) with the calibrated work factor.
+        """
+        self.get_executor()
+        return self.run("hash", bcrypt.hashpw, password.encode("utf-8"),
+                        bcrypt.gensalt(self.rounds))
+
+    def check(self, password_hash, password):
+        """
+        Takes a stored password_hash(bytes or str) and a password(str).
+        Returns True(bool) when they match, else False(bool).
+        """
+        if isinstance(password_hash, str):
+            password_hash = password_hash.encode("ascii")
+        return self.run("check", bcrypt.checkpw, password.encode("utf-8"), password_hash)
+
+    def needs_rehash(self, password_hash):
+        """
+        Takes a stored password_hash(bytes or str).
+        Returns True(bool) when it was made with a lower work factor than the current one.
+        Stronger hashes are kept, a login never replaces them with a weaker one.
+        """
+        self.get_executor()
+        return get_rounds(password_hash) < self.rounds
+
+    def shutdown(self):
+        """
+        Stops the process pool, a later call starts a new one.
+        """
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def record(self, operation, seconds):
+        """
+        Takes an operation(str) and the latency(float) of one call, queue wait included,
+        and adds them to the operation's counters.
+        """
+        with self.lock:
+            stats = self.stats.setdefault(operation, {
+                "count": 0, "seconds": 0.0, "latencies": deque(maxlen=LATENCY_SAMPLES)})
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            stats["latencies"].append(seconds)
+
+    def get_stats(self):
+        """
+        Returns a dict with the work factor, the number of rejected calls and per operation(str)
+        the call count, average, median and 95th percentile latency in ms.
+        """
+        with self.lock:
+            operations = {}
+            for operation, stats in self.stats.items():
+                latencies = sorted(stats["latencies"])
+                operations[operation] = {
+                    "count": stats["count"],
+                    "avg_ms": round(stats["seconds"] / stats["count"] * 1000, 1),
+                    "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+                    "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+                }
+            return {"rounds": self.rounds, "rejected": self.rejected, "operations": operations}
+
+
+password_hasher = HashingService()
@@ -0,0 +1,271 @@
+"""
+Outbox for emails such as password reset codes.
+Routes only add a row to the MailOutbox table, committed together with their own changes,
+and a background thread delivers the queue over one logged in SMTP connection that is kept
+open between batches. Failed sends are retried with exponential backoff up to MAX_ATTEMPTS.
+"""
+
+import os
+import random
+import smtplib
+import threading
+import time
+
+from collections import Counter
+from email.message import EmailMessage
+
+from sqlalchemy import select, update, func
+
+from flasktest import app, db
+from flasktest.models import MailOutbox
+
+GMAIL_EMAIL = os.environ["GMAIL_EMAIL"]
+GMAIL_PASS = os.environ["GMAIL_PASS"]
+GMAIL_SMTP = os.environ["GMAIL_SMTP"]
+
+BATCH_SIZE = 20
+MAX_ATTEMPTS = 5
+RETRY_BASE = 30  # seconds before the first retry, doubled after every failure
+RETRY_MAX = 3600
+SENDING_LEASE = 120  # seconds a sender holds a message before another sender may take it
+IDLE_TIMEOUT = 60  # seconds an unused connection is kept open
+POLL_INTERVAL = 30  # seconds between outbox checks when nothing wakes the sender
+SMTP_TIMEOUT = 10
+PENDING_STATES = ("queued", "sending")
+
+
+def queue_mail(to_addr, subject, body):
+    """
+    Takes a to_addr(str), subject(str) and body(str) and adds the email to the outbox.
+    It is committed with the callers own changes, after which mail_sender.wake() sends it.
+    """
+    now = time.time()
+    # noinspection PyArgumentList
+    db.session.add(MailOutbox(to_addr=to_addr, subject=subject, body=body, status="queued",
+                              attempts=0, next_attempt=now, created=now))
+
+
+def get_backoff(attempts, base=RETRY_BASE, maximum=RETRY_MAX):
+    """
+    Takes the number(int) of failed attempts so far.
+    Returns the seconds(float) to wait before the next one, doubling per failure with jitter.
+    """
+    return min(maximum, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+
+
+class MailSender:
+    """
+    Class containing the background sender thread and its SMTP connection.
+    """
+    def __init__(self, host, user, password, from_addr, starttls=True, batch_size=BATCH_SIZE,
+                 max_attempts=MAX_ATTEMPTS, retry_base=RETRY_BASE, idle_timeout=IDLE_TIMEOUT,
+                 poll_interval=POLL_INTERVAL):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.from_addr = from_addr
+        self.starttls = starttls
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+
+        self.connection = None
+        self.last_used = 0
+        self.thread = None
+        self.stopping = False
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = Counter()  # sent, retried, failed and connections opened
+
+    def __repr__(self):
+        return f"MailSender(host={self.host}, connected={self.connection is not None})"
+
+    def start(self):
+        """
+        Starts the sender thread, once per process.
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopping = False
+                self.thread = threading.Thread(target=self.run, name="mail-sender", daemon=True)
+                self.thread.start()
+
+    def wake(self):
+        """
+        Makes the sender check the outbox now, starting it if needed.
+        """
+        self.start()
+        self.wakeup.set()
+
+    def stop(self):
+        """
+        Stops the sender thread after its current batch and closes the connection.
+        """
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        """
+        Sends due emails until stopped, sleeping until the next retry is due or it is woken.
+        """
+        with app.app_context():
+            while not self.stopping:
+                sent = 0
+                try:
+                    sent = self.send_batch()
+                    wait = self.get_wait()
+                except Exception:
+                    app.logger.exception("mail sender failed")
+                    db.session.rollback()
+                    wait = self.poll_interval
+                finally:
+                    db.session.remove()
+
+                if sent == self.batch_size:
+                    continue
+                if self.connection is not None \
+                        and time.time() - self.last_used >= self.idle_timeout:
+                    self.close()
+                self.wakeup.wait(wait)
+                self.wakeup.clear()
+            self.close()
+
+    def get_wait(self):
+        """
+        Returns the seconds(float) until the next pending email is due, at most poll_interval,
+        and no longer than the open connection may stay idle.
+        """
+        next_attempt = db.session.execute(
+            select(func.min(MailOutbox.next_attempt))
+            .where(MailOutbox.status.in_(PENDING_STATES))).scalar()
+        wait = self.poll_interval
+        if next_attempt is not None:
+            wait = min(wait, next_attempt - time.time())
+        if self.connection is not None:
+            wait = min(wait, self.last_used + self.idle_timeout - time.time())
+        return max(wait, 0)
+
+    def claim_batch(self):
+        """
+        Takes up to batch_size due emails for this sender, holding each for SENDING_LEASE
+        seconds so other processes skip them, and emails whose sender died are taken over.
+        Returns a list of MailOutbox rows.
+        """
+        now = time.time()
+        due = MailOutbox.status.in_(PENDING_STATES), MailOutbox.next_attempt <= now
+        ids = db.session.execute(
+            select(MailOutbox.id).where(*due)
+            .order_by(MailOutbox.next_attempt).limit(self.batch_size)).scalars().all()
+
+        claimed = []
+        for message_id in ids:
+            result = db.session.execute(
+                update(MailOutbox).where(MailOutbox.id == message_id, *due)
+                .values(status="sending", next_attempt=now + SENDING_LEASE))
+            if result.rowcount:
+                claimed.append(message_id)
+        db.session.commit()
+        if not claimed:
+            return []
+        return MailOutbox.query.filter(MailOutbox.id.in_(claimed)).order_by(MailOutbox.id).all()
+
+    def send_batch(self):
+        """
+        Sends the due emails over the shared connection, saving each result as it goes.
+        Returns the number(int) of emails attempted.
+        """
+        messages = self.claim_batch()
+        for message in messages:
+            try:
+                self.deliver(message)
+            except Exception as error:
+                # Such as a header that cannot be encoded, counted like a refusal so the
+                # message is given up on instead of being claimed again forever
+                if not isinstance(error, (smtplib.SMTPException, OSError)):
+                    app.logger.exception(f"unexpected error sending email {message.id}")
+                # A refused message leaves the connection usable, anything else drops it
+                if not isinstance(error, smtplib.SMTPResponseException):
+                    self.close()
+                message.attempts += 1
+                message.error = (str(error) or type(error).__name__)[:200]
+                if message.attempts >= self.max_attempts:
+                    message.status = "failed"
+                    self.stats["failed"] += 1
+                    app.logger.error(f"giving up on email {message.id}: {error}")
+                else:
+                    message.status = "queued"
+                    message.next_attempt = time.time() + get_backoff(message.attempts,
+                                                                     self.retry_base)
+                    self.stats["retried"] += 1
+            else:
+                message.status = "sent"
+                message.sent = time.time()
+                message.error = None
+                self.stats["sent"] += 1
+            db.session.commit()
+        return len(messages)
+
+    def deliver(self, message):
+        """
+        Takes a message(class) and sends it, opening a new connection when there is none
+        or the server has dropped the one kept open.
+        """
+        email = EmailMessage()
+        email["From"] = self.from_addr
+        email["To"] = message.to_addr
+        email["Subject"] = message.subject
+        email.set_content(message.body)
+
+        try:
+            self.get_connection().send_message(email)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self.get_connection().send_message(email)
+        self.last_used = time.time()
+
+    def get_connection(self):
+        """
+        Returns the open SMTP connection, else connects and logs in.
+        """
+        if self.connection is None:
+            connection = smtplib.SMTP(self.host, timeout=SMTP_TIMEOUT)
+            try:
+                if self.starttls:
+                    connection.starttls()
+                if self.user:
+                    connection.login(user=self.user, password=self.password)
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+                raise
+            self.connection = connection
+            self.stats["connections"] += 1
+        return self.connection
+
+    def close(self):
+        """
+        Closes the SMTP connection if there is one.
+        """
+        if self.connection is None:
+            return
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
+        self.connection = None
+
+
+mail_sender = MailSender(GMAIL_SMTP, GMAIL_EMAIL, GMAIL_PASS, GMAIL_EMAIL)
+
+
+@app.before_request
+def start_mail_sender():
+    """
+    Starts the sender with the first request a process serves, so emails left queued or
+    half sent by the last run go out without waiting for a new reset request.
+    Importing the app never starts it, the bcrypt workers and cli commands import it too.
+    """
+    mail_sender.start()
@@ -1,26 +1,26 @@
 from flask import Blueprint
 
 import random
-import math
-import smtplib
-import time
 import os
+import time
+
+import click
 
 from flask import render_template, redirect, url_for, request, flash, session
 from flask_login import login_user, login_required, logout_user
 
 import flasktest.models
-from flasktest import db, bcrypt
-from flasktest.models import User, APIData, add_test_user, add_new_user
+from flasktest import app, db
+from flasktest.models import User, provision_user, provision_users
 from flasktest.users.forms import RegisterForm, LoginForm, EmailForm, ResetForm
+from flasktest.users.hashing import password_hasher, HashingBusy
+from flasktest.users.mail import queue_mail, mail_sender
 
 users = Blueprint("users", __name__)
 
-GMAIL_EMAIL = os.environ["GMAIL_EMAIL"]
-GMAIL_PASS = os.environ["GMAIL_PASS"]
-GMAIL_SMTP = os.environ["GMAIL_SMTP"]
 TEST_EMAIL = os.environ["TEST_EMAIL"]
 TEST_EMAIL2 = os.environ["TEST_EMAIL2"]
+HASHING_BUSY = "The server is busy, please try again in a moment."
 
 
 @users.route("/")
@@ -30,13 +30,10 @@ def index():
 
 @users.route("/fresh")
 def base():
-    """Create two dummy accounts and API defaults after db reset"""
-    hashed_password = bcrypt.generate_password_hash("test1234")
-    add_test_user(email=TEST_EMAIL, username="test1", hashed_password=hashed_password)
-    add_test_user(email=TEST_EMAIL2, username="test2", hashed_password=hashed_password)
-    pubg_api = APIData(api_name="pubg", last_used=math.floor(time.time()), timer=60)
-    db.session.add(pubg_api)
-    db.session.commit()
+    """Create two dummy accounts after db reset"""
+    hashed_password = password_hasher.hash("test1234")
+    provision_user(email=TEST_EMAIL, username="test1", hashed_password=hashed_password)
+    provision_user(email=TEST_EMAIL2, username="test2", hashed_password=hashed_password)
     return redirect(url_for("users.login"))
 
 
@@ -53,7 +50,15 @@ def login():
     if login_form.validate_on_submit():
         user = User.query.filter_by(email=login_form.email.data).first()
 
-        if not flasktest.models.do_passwords_match(user, login_form.password):
+        try:
+            passwords_match = flasktest.models.do_passwords_match(user, login_form.password)
+        except HashingBusy:
+            flash(HASHING_BUSY)
+            return render_template("/landing/login.html",
+                                   login_form=login_form,
+                                   register_form=register_form), 503
+
+        if not passwords_match:
             flash("Password incorrect.")
 
         else:
@@ -84,15 +89,22 @@ def register():
                                register_form=register_form)
 
     if register_form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(register_form.password.data)
-        add_new_user(
-            email=register_form.email,
-            username=register_form.username,
+        try:
+            hashed_password = password_hasher.hash(register_form.password.data)
+        except HashingBusy:
+            flash(HASHING_BUSY)
+            return render_template("/landing/register.html",
+                                   register_form=register_form), 503
+        new_user = provision_user(
+            email=register_form.email.data,
+            username=register_form.username.data,
             hashed_password=hashed_password,
             )
-        return redirect(url_for("users.login"))
+        if new_user is not None:
+            return redirect(url_for("users.login"))
+        register_form.email.errors.append("Email already registered")
 
-    # Form not validated
+    # Form not validated or email already registered
     return render_template("/landing/register.html",
                            register_form=register_form)
 
@@ -111,17 +123,13 @@ def request_reset():
 
         reset_code = random.randint(100000, 999999)
         user.reset_key = reset_code
+        # Saved with the reset key and sent in the background, see users/mail.py
+        queue_mail(to_addr=user.email, subject="Reset Code",
+                   body=f"Your reset code: {reset_code}")
         db.session.commit()
-        with smtplib.SMTP(GMAIL_SMTP) as connection:
-            connection.starttls()
-            connection.login(user=GMAIL_EMAIL, password=GMAIL_PASS)
-            connection.sendmail(
-                from_addr=GMAIL_EMAIL,
-                to_addrs=user.email,
-                msg=f"Subject:Reset Code\n\nYour reset code: {reset_code}"
-            )
-            flash("Code hes been send!")
-            return redirect(url_for("users.enter_reset"))
+        mail_sender.wake()
+        flash("Code hes been send!")
+        return redirect(url_for("users.enter_reset"))
 
     # Request reset form not validated
     return render_template("/landing/request_reset.html",
@@ -153,10 +161,31 @@ def enter_reset():
                                    reset_form=reset_form)
 
         # Password reset successful
-        hashed_password = bcrypt.generate_password_hash(reset_form.password.data)
+        try:
+            hashed_password = password_hasher.hash(reset_form.password.data)
+        except HashingBusy:
+            flash(HASHING_BUSY)
+            return render_template("/landing/enter_reset.html",
+                                   reset_form=reset_form), 503
         flasktest.models.change_password(user.id, hashed_password)
         return redirect("login")
 
     # Enter reset form not validated
     return render_template("/landing/enter_reset.html",
-                           reset_form=reset_form)
\ No newline at end of file
+                           reset_form=reset_form)
+
+
+@app.cli.command("seed-users")
+@click.argument("count", type=int)
+def seed_users_command(count):
+    """
+    Creates COUNT accounts for load testing, all with the password test1234.
+    """
+    hashed_password = password_hasher.hash("test1234")
+    run = int(time.time())
+    start = time.perf_counter()
+    created = provision_users({"email": f"load{run}-{number}@example.com",
+                               "username": f"load{number}",
+                               "hashed_password": hashed_password}
+                              for number in range(count))
+    print(f"Created {created} users in {time.perf_counter() - start:.1f} s.")
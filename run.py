@@ -1,5 +1,5 @@
-from flasktest import app
-
-
 if __name__ == '__main__':
+    # Imported here, not at the top, as the bcrypt worker processes import this module again
+    from flasktest import app
+
     app.run(debug=True)